@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings
 import os
 from functools import lru_cache
+from typing import Optional
 
 
 class PromptTemplates:
@@ -891,13 +892,39 @@ class Settings(BaseSettings):
     AGENT_DEFAULT_ADVANCED_TOOLS: bool = True  # 是否默认启用高级工具
     AGENT_ENABLE_SELF_EVALUATION: bool = True  # 是否启用自我评估（包含任務完成度評估）
     AGENT_AUTO_SAVE_MEMORY: bool = True  # 是否自动保存记忆
+    AGENT_SHUTDOWN_DRAIN_TIMEOUT: float = 10.0  # 應用關閉時等待Agent背景任務（聊天記錄、記憶更新）完成的最長時間（秒）
+    AGENT_MEMORY_CONCURRENCY: int = 4  # 后台记忆更新的最大并发数（每次更新都是一次LLM调用）
+    AGENT_MEMORY_CACHE_TTL: int = 60  # 記憶服務讀取用戶記憶的快取時間（秒），任何記憶寫入後立即失效，0 表示不快取
     AGENT_MAX_EXECUTION_TIME: int = 300  # 最大執行時間（秒），防止無限執行
     AGENT_MAX_CONSECUTIVE_FAILURES: int = 3  # 連續失敗上限，超過則停止
     AGENT_ENABLE_GROUND_TRUTH: bool = True  # 啟用 Ground Truth 驗證
     AGENT_ENABLE_DYNAMIC_REFLECTION: bool = True  # 啟用動態反思觸發
     AGENT_LOOP_DETECTION_WINDOW: int = 6  # 循環檢測窗口大小
     AGENT_TOOL_TIMEOUT_THRESHOLD: int = 30000  # 工具執行超時閾值（毫秒），超過觸發反思
+    AGENT_TOOL_EXECUTION_TIMEOUT: float = 120.0  # 單個工具調用的最長執行時間（秒），超時返回錯誤結果
     AGENT_MAX_LLM_RETRIES: int = 3  # LLM請求最大重試次數
+    AGENT_MAX_CONCURRENT_LLM: int = 8  # 所有 Agent 執行共用的 LLM 並發請求上限
+    AGENT_STREAM_TOKENS: bool = True  # 是否逐段推送模型輸出（status="streaming" 事件）
+    AGENT_STREAM_FLUSH_INTERVAL: float = 0.033  # streaming 事件合併推送的最短間隔（秒），約30次/秒
+    AGENT_CONTEXT_BUDGET_TOKENS: int = 24000  # 每次LLM請求的上下文預算（估算token），超出時省略較早的工具輪次
+    AGENT_CONTEXT_KEEP_LAST: int = 4  # 上下文裁剪時至少保留的最近輪次數
+    AGENT_LOCAL_SUMMARY: bool = False  # 達到最大步驟數時直接以推理步驟拼接總結，不再調用LLM
+    AGENT_SUMMARY_MODEL: str = ""  # 達到最大步驟數時生成總結所用的模型（可配置較便宜的模型），為空時使用當前模型
+    AGENT_TRACE_VERBOSE: bool = False  # 返回完整執行軌跡；關閉時工具參數與結果只保留名稱和長度摘要
+    AGENT_TRACE_MAX_ENTRIES: int = 200  # 精簡執行軌跡最多返回的條目數（保留最近的條目）
+    AGENT_RETRY_BASE_S: float = 1.0  # 速率限制重試的初始等待時間（秒），之後每次翻倍
+    AGENT_RETRY_JITTER_S: float = 1.0  # 每次重試附加的隨機抖動上限（秒）
+    AGENT_RETRY_CAP_S: float = 60.0  # 速率限制重試的最長等待時間（秒），指數退避+隨機抖動
+    AGENT_TEMPERATURE: Optional[float] = None  # Agent 請求的生成溫度，None 表示使用各 Provider 默認值
+    AGENT_ENABLE_LLM_CACHE: bool = False  # 啟用LLM響應快取（相同模型、消息與工具時直接返回；僅在 AGENT_TEMPERATURE=0 的確定性請求時生效）
+    AGENT_CACHE_TTL: int = 600  # LLM響應快取過期時間（秒）
+    AGENT_CACHE_MAX_ENTRIES: int = 256  # LLM響應快取最大條目數
+    AGENT_ENABLE_TOOL_CACHE: bool = False  # 啟用工具結果快取（相同工具與參數直接返回上次結果；僅限搜索、網頁抓取等不經過LLM的工具，進程內所有用戶共享）
+    AGENT_ENABLE_PLAN_CACHE: bool = False  # 啟用執行計劃快取（相同請求重放上次的工具調用序列，僅需一次LLM綜合回覆）
+    AGENT_PLAN_CACHE_TTL: int = 3600  # 執行計劃快取過期時間（秒）
+    AGENT_ENABLE_RESPONSE_CACHE: bool = False  # 啟用完整回覆快取（同一用戶、模型、提示與工具集合直接返回上次回覆，跳過整個推理循環）
+    AGENT_RESPONSE_CACHE_TTL: int = 300  # 完整回覆快取過期時間（秒），時效性問題應保持較短
+    AGENT_ENABLE_TOOL_PREFETCH: bool = False  # 啟用工具預取（依歷史工具調用順序預測下一個工具，在等待LLM響應時提前執行；僅限可快取工具，需啟用工具快取）
     
     # HTTP 超時配置
     LLM_REQUEST_TIMEOUT: float = 600.0  # LLM 請求超時（秒）
@@ -50,6 +50,43 @@ file_metadata_collection = db["file_metadata"]
 # 圖片集合（异步）
 image_collection = async_db["images"]
 
+# 聊天记录与用户记忆集合（异步，供请求热路径使用，避免阻塞事件循环）
+async_chat_log_collection = async_db["chat_logs"]
+async_memory_collection = async_db["memories"]
+
+
+async def ensure_indexes():
+    """
+    创建查询所需的索引（启动时调用，索引已存在时为空操作）
+    
+    均为非唯一索引：旧数据中可能存在缺少 interaction_id 或重复 user_id 的记录
+    """
+    index_specs = {
+        "chat_logs": [
+            [("user_id", 1), ("timestamp", -1)],  # get_chat_logs：按用户取最近记录
+            [("interaction_id", 1), ("user_id", 1)],  # get_chat_by_interaction_id
+        ],
+        "chat_sessions": [
+            [("session_id", 1), ("user_id", 1)],  # 按会话读写
+            [("user_id", 1), ("updated_at", -1)],  # get_user_chat_sessions：按更新时间列出会话
+        ],
+        "memories": [
+            [("user_id", 1)],
+        ],
+        "usage": [
+            [("user_id", 1), ("date", 1)],
+        ],
+        "file_metadata": [
+            [("file_id", 1)],
+        ],
+    }
+    for collection_name, indexes in index_specs.items():
+        for keys in indexes:
+            try:
+                await async_db[collection_name].create_index(keys)
+            except Exception as e:
+                logger.error(f"创建索引失败: {collection_name} {keys}: {str(e)}")
+
 
 def get_database():
     """获取数据库连接"""
@@ -223,8 +260,8 @@ async def create_chat_log(user_id: str, model: str, prompt: str, reply: str, int
     }
     
     try:
-        # 同步插入操作改为手动处理，避免直接await非awaitable对象
-        result = chat_log_collection.insert_one(chat_log)
+        # 使用异步客户端插入，不阻塞事件循环
+        result = await async_chat_log_collection.insert_one(chat_log)
         return {"id": str(result.inserted_id), "success": True}
     except Exception as e:
         logger.error(f"创建聊天记录错误: {str(e)}")
@@ -482,12 +519,20 @@ def get_user_memory(user_id: str):
     return ""
 
 
-def update_usage(user_id: str, model: str):
-    """更新用户使用量"""
+async def aget_user_memory(user_id: str) -> str:
+    """获取用户记忆（异步版本，只读取 memory 字段）"""
+    memory_doc = await async_memory_collection.find_one({"user_id": user_id}, {"memory": 1})
+    if memory_doc:
+        return memory_doc.get("memory", "")
+    return ""
+
+
+def update_usage(user_id: str, model: str, count: int = 1):
+    """更新用户使用量（count 为本次累加的调用次数）"""
     current_date = datetime.now().strftime("%Y-%m-%d")
     usage_collection.update_one(
         {"user_id": user_id, "date": current_date},
-        {"$inc": {f"models.{model}": 1}},
+        {"$inc": {f"models.{model}": count}},
         upsert=True
     )
 
@@ -1,10 +1,18 @@
 import sqlite3
+import asyncio
+from typing import Optional
 from app.core.config import get_settings
 import logging
 
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# 聊天记录后台写入队列（由单一写入任务批量落盘，避免阻塞事件循环）
+_CHAT_LOG_INSERT_SQL = "INSERT INTO chat_log (user_id, model, prompt, reply, interaction_id) VALUES (?, ?, ?, ?, ?)"
+_WRITER_BATCH_SIZE = 100
+_log_queue: Optional[asyncio.Queue] = None
+_writer_task: Optional[asyncio.Task] = None
+
 # 初始化SQLite连接和表
 def init_sqlite():
     """初始化SQLite数据库"""
@@ -51,7 +59,7 @@ def create_chat_log_sqlite(user_id: str, model: str, prompt: str, reply: str, in
         conn = sqlite3.connect(settings.SQLITE_DB)
         cursor = conn.cursor()
         cursor.execute(
-            "INSERT INTO chat_log (user_id, model, prompt, reply, interaction_id) VALUES (?, ?, ?, ?, ?)",
+            _CHAT_LOG_INSERT_SQL,
             (user_id, model, prompt, reply, interaction_id)
         )
         conn.commit()
@@ -62,19 +70,108 @@ def create_chat_log_sqlite(user_id: str, model: str, prompt: str, reply: str, in
         return False
 
 
-def update_usage_sqlite(user_id: str, model: str, date: str):
-    """更新用户使用量"""
+def enqueue_chat_log_sqlite(user_id: str, model: str, prompt: str, reply: str, interaction_id: str = None):
+    """将聊天记录放入后台写入队列，写入任务未启动或已异常退出时直接同步写入"""
+    if _log_queue is None or _writer_task is None or _writer_task.done():
+        return create_chat_log_sqlite(user_id, model, prompt, reply, interaction_id)
+    _log_queue.put_nowait((user_id, model, prompt, reply, interaction_id))
+    return True
+
+
+def _open_writer_connection():
+    """打开写入任务专用的连接（WAL模式，降低每次提交的fsync开销）"""
+    conn = sqlite3.connect(settings.SQLITE_DB, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _write_chat_log_batch(conn, batch):
+    """批量写入聊天记录"""
+    conn.executemany(_CHAT_LOG_INSERT_SQL, batch)
+    conn.commit()
+
+
+async def _sqlite_writer_loop(queue: asyncio.Queue):
+    """后台写入循环：每次取出队列中已有的记录（最多100条）合并为一次提交"""
+    conn = await asyncio.to_thread(_open_writer_connection)
+    try:
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < _WRITER_BATCH_SIZE:
+                batch.append(queue.get_nowait())
+            try:
+                await asyncio.to_thread(_write_chat_log_batch, conn, batch)
+            except Exception as e:
+                logger.error(f"批量写入聊天记录失败（{len(batch)}条）: {str(e)}")
+            finally:
+                for _ in batch:
+                    queue.task_done()
+    finally:
+        conn.close()
+
+
+def _on_writer_done(task: asyncio.Task):
+    """写入任务结束回调：异常退出时记录错误（之后的记录由 enqueue_chat_log_sqlite 回退为同步写入）"""
+    if task.cancelled():
+        return
+    exc = task.exception()
+    if exc is not None:
+        pending = _log_queue.qsize() if task is _writer_task and _log_queue is not None else 0
+        logger.error(
+            f"SQLite后台写入任务异常退出，后续聊天记录改为同步写入，队列中{pending}条记录未写入: {str(exc)}",
+            exc_info=exc
+        )
+
+
+def start_sqlite_writer():
+    """启动SQLite后台写入任务（需在事件循环中调用）"""
+    global _log_queue, _writer_task
+    if _writer_task is not None and not _writer_task.done():
+        return
+    _log_queue = asyncio.Queue()
+    _writer_task = asyncio.create_task(_sqlite_writer_loop(_log_queue))
+    _writer_task.add_done_callback(_on_writer_done)
+    logger.info("SQLite后台写入任务已启动")
+
+
+async def stop_sqlite_writer(timeout: float = 10.0):
+    """等待队列中的记录写完后停止后台写入任务"""
+    global _log_queue, _writer_task
+    if _writer_task is None:
+        return
+    queue, task = _log_queue, _writer_task
+    # 先切回同步写入，避免关闭过程中新记录进入队列后丢失
+    _log_queue, _writer_task = None, None
+    # 写入任务已异常退出时队列无人消费，无需等待
+    if not task.done():
+        try:
+            await asyncio.wait_for(queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"SQLite写入队列未能在{timeout}秒内清空，剩余{queue.qsize()}条记录被丢弃")
+    task.cancel()
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        pass  # 异常退出已由 _on_writer_done 记录
+    logger.info("SQLite后台写入任务已停止")
+
+
+def update_usage_sqlite(user_id: str, model: str, date: str, count: int = 1):
+    """更新用户使用量（count 为本次累加的调用次数）"""
     try:
         conn = sqlite3.connect(settings.SQLITE_DB)
         cursor = conn.cursor()
         cursor.execute(
             """
             INSERT INTO usage_stats (user_id, model, date, count)
-            VALUES (?, ?, ?, 1)
+            VALUES (?, ?, ?, ?)
             ON CONFLICT(user_id, model, date) 
-            DO UPDATE SET count = count + 1
+            DO UPDATE SET count = count + excluded.count
             """,
-            (user_id, model, date)
+            (user_id, model, date, count)
         )
         conn.commit()
         conn.close()
@@ -11,6 +11,7 @@ from pydantic import BaseModel
 import uuid
 from datetime import datetime
 import json
+import orjson
 import asyncio
 
 from fastapi.responses import StreamingResponse
@@ -67,6 +68,11 @@ class UnifiedAgentRequest(BaseModel):
 # 輔助函數：驗證和預處理
 # ============================================================
 
+def _sse_event(data: Dict[str, Any]) -> bytes:
+    """將事件數據編碼為 SSE 數據幀（orjson 直接輸出 UTF-8 bytes，datetime 原生序列化）"""
+    return b"data: " + orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS) + b"\n\n"
+
+
 async def validate_request(body: dict, settings: Settings) -> None:
     """驗證請求參數"""
     model_name = body.get("model_name", settings.AGENT_DEFAULT_MODEL)
@@ -220,14 +226,15 @@ async def agent_stream(
                 "status": "error",
                 "message": error_detail,
                 "is_final": True,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "details": {"error": True, "status_code": error_status}
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield _sse_event(error_data)
         
         return StreamingResponse(error_generator(), media_type="text/event-stream")
 
     async def event_generator():
+        # 不設上限的隊列：on_step 只入隊即返回，Agent 主循環不會因客戶端讀取緩慢而阻塞
         queue = asyncio.Queue()
         nonlocal step_counter
         final_result = None
@@ -246,7 +253,7 @@ async def agent_stream(
                 "tool_result": step.get("tool_result"),
                 "reasoning": step.get("reasoning"),
                 "is_final": step.get("is_final", False),
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "details": step.get("details", {})
             }
             
@@ -321,7 +328,7 @@ async def agent_stream(
                     "status": "error",
                     "message": str(e),
                     "is_final": True,
-                    "timestamp": datetime.utcnow().isoformat(),
+                    "timestamp": datetime.utcnow(),
                     "details": {"error": True}
                 })
             finally:
@@ -335,7 +342,7 @@ async def agent_stream(
                 data = await queue.get()
                 if data is None:
                     break
-                yield f"data: {json.dumps(data, ensure_ascii=False)}\n\n"
+                yield _sse_event(data)
         except Exception as e:
             logger.error(f"事件生成器錯誤: {str(e)}")
             error_data = {
@@ -343,10 +350,10 @@ async def agent_stream(
                 "status": "error",
                 "message": str(e),
                 "is_final": True,
-                "timestamp": datetime.utcnow().isoformat(),
+                "timestamp": datetime.utcnow(),
                 "details": {"error": True}
             }
-            yield f"data: {json.dumps(error_data, ensure_ascii=False)}\n\n"
+            yield _sse_event(error_data)
         finally:
             if not agent_task.done():
                 agent_task.cancel()
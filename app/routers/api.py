@@ -1,12 +1,15 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
 from fastapi.responses import StreamingResponse, Response
 from typing import List, Dict, Any, Optional
+from functools import lru_cache
 import uuid
 from datetime import datetime
 import logging
 import asyncio
+import heapq
 import json
 import os
+import orjson
 import time
 import urllib.parse
 from bson import ObjectId
@@ -21,15 +24,28 @@ from app.models.mongodb import (
     # 图片相关函数
     save_image_to_mongodb, get_image_from_mongodb, get_session_images
 )
-from app.models.sqlite import create_chat_log_sqlite
+from app.models.sqlite import enqueue_chat_log_sqlite
 from app.core.dependencies import get_api_key, get_settings_dependency
-from app.core.config import Settings
+from app.core.config import Settings, get_settings
 from app.services.llm_service import llm_service
-from app.services.memory_service import memory_service
+from app.services.memory_service import memory_service, memory_update_semaphore
 import models as schemas
 
-# 创建API路由
-router = APIRouter()
+class OrjsonResponse(Response):
+    """
+    使用orjson序列化的JSON响应类
+
+    路由返回值在渲染前已经过 jsonable_encoder 转换（ObjectId 等由 json_serialize_mongodb 预先处理），
+    这里只负责用orjson输出字节
+    """
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
+# 创建API路由（默认使用orjson序列化响应）
+router = APIRouter(default_response_class=OrjsonResponse)
 
 # 辅助函数：确保MongoDB对象可以被JSON序列化
 def json_serialize_mongodb(obj):
@@ -46,10 +62,16 @@ def json_serialize_mongodb(obj):
         return [json_serialize_mongodb(i) for i in obj]
     return obj
 
+# 进行中的后台任务（保留引用，避免任务在执行中被垃圾回收）
+_background_tasks: set = set()
+
+
 # 记忆更新的后台任务函数
 async def background_memory_update(user_id: str, prompt: str):
     try:
-        await memory_service.update_memory(user_id, prompt)
+        # 通过信号量限制并发的记忆更新数量
+        async with memory_update_semaphore:
+            await memory_service.update_memory(user_id, prompt)
         logger.info(f"后台记忆更新任务已完成，用户ID: {user_id}")
     except Exception as e:
         logger.error(f"后台记忆更新任务失败，用户ID: {user_id}, 错误: {str(e)}")
@@ -129,7 +151,7 @@ async def chat_completion(
                     "content": msg.get("content")
                 })
             
-            logger.info(f"从会话获取的历史消息数量: {len(history_messages)}")
+            logger.info("从会话获取的历史消息数量: %d", len(history_messages))
         else:
             logger.info(f"会话不存在或无历史消息: session_id={session_id}")
             
@@ -151,14 +173,16 @@ async def chat_completion(
                 if entry.get("reply"):
                     history_messages.append({"role": "assistant", "content": entry.get("reply")})
             
-            logger.info(f"使用数据库获取的历史消息，数量: {len(history_messages)}")
+            logger.info("使用数据库获取的历史消息，数量: %d", len(history_messages))
         else:
             logger.info("数据库中没有找到历史消息")
     
     # 准备完整的消息列表：系统提示 + 历史消息 + 当前用户消息
     full_messages = [system_prompt] + history_messages + user_messages
     
-    logger.info(f"完整消息列表: {full_messages}")
+    # 消息列表可能包含base64图片/音频，仅在DEBUG级别时才格式化输出
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("完整消息列表: %s", full_messages)
     
     # 清除之前可能存在的图片数据
     llm_service.last_generated_image = None
@@ -197,7 +221,7 @@ async def chat_completion(
                 try:
                     # 尝试从工具结果中提取消息
                     content_str = tool_result.get("content", "")
-                    logger.info(f"工具结果内容长度: {len(content_str)}")
+                    logger.info("工具结果内容长度: %d", len(content_str))
                     
                     # 检查内容是否为空
                     if not content_str:
@@ -208,7 +232,7 @@ async def chat_completion(
                     image_url = None
                     
                     if image_data_uri:
-                        logger.info(f"从LLM服务获取图片dataURI，长度: {len(image_data_uri)}")
+                        logger.info("从LLM服务获取图片dataURI，长度: %d", len(image_data_uri))
                         
                         # 检查是否提供了session_id
                         session_id = getattr(request, 'session_id', None)
@@ -336,10 +360,12 @@ async def chat_completion(
               # 如果会话的第一条消息，智能生成标题
         session = get_chat_session(session_id, request.user_id)
         if session and session.get('message_count', 0) <= 2:  # 第一轮对话（用户+助手=2条消息）
-            # 使用智能標題生成
-            smart_title = await generate_smart_title(user_message_content, message)
-            update_session_title(session_id, request.user_id, smart_title)
-            logger.info(f"已为会话智能生成标题: {smart_title}")
+            # 使用智能標題生成（独立的LLM请求，在后台进行，不阻塞响应返回）
+            title_task = asyncio.create_task(
+                _update_smart_title(session_id, request.user_id, user_message_content, message)
+            )
+            _background_tasks.add(title_task)
+            title_task.add_done_callback(_background_tasks.discard)
             
     else:
         # 保持原有的兼容性逻辑
@@ -354,8 +380,8 @@ async def chat_completion(
             interaction_id
         )
         
-        # 同时将对话记录保存到SQLite（作为备份或兼容旧系统）
-        create_chat_log_sqlite(
+        # 同时将对话记录保存到SQLite（作为备份或兼容旧系统，由后台任务批量写入）
+        enqueue_chat_log_sqlite(
             request.user_id,
             request.model,
             user_message_content,
@@ -365,7 +391,9 @@ async def chat_completion(
     
     # 在后台异步更新用户长期记忆
     prompt = user_message_content
-    asyncio.create_task(background_memory_update(request.user_id, prompt))
+    task = asyncio.create_task(background_memory_update(request.user_id, prompt))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
     logger.info(f"记忆更新任务已在后台启动，用户ID: {request.user_id}")    
     # 返回完整响应 - 與 Agent 模式保持一致的增強結構
     return {
@@ -480,6 +508,21 @@ async def get_chat_history(
     return {"history": serialized_history}
 
 
+# 本地檔案元數據（MongoDB不可用時的備援存儲）
+def _load_local_metadata(metadata_file: str) -> List[Dict[str, Any]]:
+    """讀取本地 metadata.json，檔案不存在時返回空列表"""
+    if not os.path.exists(metadata_file):
+        return []
+    with open(metadata_file, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def _save_local_metadata(metadata_file: str, metadata_list: List[Dict[str, Any]]) -> None:
+    """寫入本地 metadata.json（orjson 固定輸出UTF-8，等同 ensure_ascii=False）"""
+    with open(metadata_file, "wb") as f:
+        f.write(orjson.dumps(metadata_list, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+
+
 # MARK: File Upload
 @router.post("/files/upload", response_model=schemas.FileUploadResponse)
 async def upload_file(
@@ -503,29 +546,20 @@ async def upload_file(
         if tags:
             tag_list = [tag.strip() for tag in tags.split(",") if tag.strip()]
         
-        # 確保上傳目錄存在
-        upload_dir = "./data/uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
         # 讀取檔案內容
         file_content = await file.read()
         file_size = len(file_content)
         
-        # 生成檔案路徑
+        # 生成儲存檔名
         file_extension = os.path.splitext(file.filename)[1]
         stored_filename = f"{file_id}{file_extension}"
-        file_path = os.path.join(upload_dir, stored_filename)
-        
-        # 儲存檔案
-        with open(file_path, "wb") as f:
-            f.write(file_content)
         
         # 創建檔案元數據
         file_metadata = {
             "file_id": file_id,
             "filename": file.filename,
             "stored_filename": stored_filename,
-            "file_path": file_path,
+            "file_path": None,
             "file_size": file_size,
             "file_type": file.content_type or "application/octet-stream",
             "upload_time": datetime.now().isoformat(),
@@ -533,7 +567,9 @@ async def upload_file(
             "description": description,
             "tags": tag_list
         }
-          # 儲存到MongoDB（如果可用）
+        
+        # 優先儲存到MongoDB GridFS，成功時不再寫入本地檔案
+        stored_in_mongodb = False
         try:
             from app.models.mongodb import get_database, save_file_to_mongodb
             db = get_database()
@@ -546,20 +582,24 @@ async def upload_file(
                     file_content=file_content,
                     metadata=file_metadata
                 )
+                stored_in_mongodb = True
                 logger.info(f"檔案已完整儲存到MongoDB GridFS: {file_id}, GridFS ID: {gridfs_id}")
         except Exception as e:
             logger.warning(f"無法儲存到MongoDB，使用本地儲存: {str(e)}")
-            # 如果MongoDB不可用，儲存到本地JSON文件
-            metadata_file = os.path.join(upload_dir, "metadata.json")
-            if os.path.exists(metadata_file):
-                with open(metadata_file, "r", encoding="utf-8") as f:
-                    metadata_list = json.load(f)
-            else:
-                metadata_list = []
+        
+        if not stored_in_mongodb:
+            # MongoDB不可用時，儲存到本地檔案並記錄到本地JSON文件
+            upload_dir = "./data/uploads"
+            os.makedirs(upload_dir, exist_ok=True)
+            file_path = os.path.join(upload_dir, stored_filename)
+            with open(file_path, "wb") as f:
+                f.write(file_content)
             
+            file_metadata["file_path"] = file_path
+            metadata_file = os.path.join(upload_dir, "metadata.json")
+            metadata_list = _load_local_metadata(metadata_file)
             metadata_list.append(file_metadata)
-            with open(metadata_file, "w", encoding="utf-8") as f:
-                json.dump(metadata_list, f, ensure_ascii=False, indent=2)
+            _save_local_metadata(metadata_file, metadata_list)
         return schemas.FileUploadResponse(
             file_id=file_id,
             filename=file.filename,
@@ -625,8 +665,7 @@ async def download_file(
         metadata_file = os.path.join(upload_dir, "metadata.json")
         
         if os.path.exists(metadata_file):
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                metadata_list = json.load(f)
+            metadata_list = _load_local_metadata(metadata_file)
             
             file_metadata = next((m for m in metadata_list if m.get("file_id") == file_id), None)
             if file_metadata and os.path.exists(file_metadata["file_path"]):
@@ -697,21 +736,17 @@ async def list_files(
         metadata_file = os.path.join(upload_dir, "metadata.json")
         
         if os.path.exists(metadata_file):
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                metadata_list = json.load(f)
+            metadata_list = _load_local_metadata(metadata_file)
             
-            # 應用篩選條件
-            if user_id:
-                metadata_list = [m for m in metadata_list if m.get("user_id") == user_id]
-            
-            if tag_list:
-                metadata_list = [m for m in metadata_list if any(tag in m.get("tags", []) for tag in tag_list)]
-            
-            # 排序和分頁
-            metadata_list.sort(key=lambda x: x.get("upload_time", ""), reverse=True)
-            paginated_list = metadata_list[skip:skip + page_size]
+            # 單次遍歷完成篩選，只保留當前頁所需的前 skip+page_size 筆（按上傳時間倒序）
+            matched = (
+                m for m in metadata_list
+                if (not user_id or m.get("user_id") == user_id)
+                and (not tag_list or any(tag in m.get("tags", []) for tag in tag_list))
+            )
+            top_files = heapq.nlargest(skip + page_size, matched, key=lambda x: x.get("upload_time", ""))
             
-            return paginated_list
+            return top_files[skip:]
         
         # 如果都沒有找到，返回空列表
         return []
@@ -748,8 +783,7 @@ async def delete_file(
         metadata_file = os.path.join(upload_dir, "metadata.json")
         
         if os.path.exists(metadata_file):
-            with open(metadata_file, "r", encoding="utf-8") as f:
-                metadata_list = json.load(f)
+            metadata_list = _load_local_metadata(metadata_file)
             
             file_metadata = next((m for m in metadata_list if m.get("file_id") == file_id), None)
             
@@ -760,8 +794,7 @@ async def delete_file(
                 
                 # 更新元數據列表
                 metadata_list = [m for m in metadata_list if m.get("file_id") != file_id]
-                with open(metadata_file, "w", encoding="utf-8") as f:
-                    json.dump(metadata_list, f, ensure_ascii=False, indent=2)
+                _save_local_metadata(metadata_file, metadata_list)
                 
                 local_deleted = True
                 logger.info(f"從本地刪除檔案: {file_id}")
@@ -782,10 +815,46 @@ async def delete_file(
 
 
 # MARK: Get Model List
+# 各提供商的模型元信息：(provider, 設定中的模型列表欄位, 描述, 能力列表)
+_MODEL_PROVIDERS = (
+    ("github", "ALLOWED_GITHUB_MODELS", "GitHub Models提供的AI模型", ("chat", "text-generation")),
+    ("gemini", "ALLOWED_GEMINI_MODELS", "Google Gemini AI模型", ("chat", "text-generation", "multimodal")),
+    ("ollama", "ALLOWED_OLLAMA_MODELS", "Ollama本地AI模型", ("chat", "text-generation")),
+    ("nvidia_nim", "ALLOWED_NVIDIA_NIM_MODELS", "NVIDIA NIM AI模型", ("chat", "text-generation")),
+    ("openrouter", "ALLOWED_OPENROUTER_MODELS", "OpenRouter AI模型", ("chat", "text-generation")),
+)
+
+
+@lru_cache(maxsize=8)
+def _build_model_list(provider: Optional[str]) -> schemas.ModelListResponse:
+    """
+    構建模型列表響應並按提供商篩選結果緩存
+    
+    模型列表來自不可變的設定，重新載入設定（get_settings.cache_clear()）時
+    需同時調用 _build_model_list.cache_clear()
+    """
+    settings = get_settings()
+    models = [
+        schemas.ModelInfo(
+            model_id=model_id,
+            model_name=model_id,
+            provider=name,
+            description=description,
+            capabilities=list(capabilities)
+        )
+        for name, field, description, capabilities in _MODEL_PROVIDERS
+        if not provider or provider == name
+        for model_id in getattr(settings, field)
+    ]
+    return schemas.ModelListResponse(
+        models=models,
+        total_count=len(models)
+    )
+
+
 @router.get("/models", response_model=schemas.ModelListResponse)
 async def get_model_list(
     provider: Optional[str] = None,
-    settings: Settings = Depends(get_settings_dependency),
     api_key: str = Depends(get_api_key)
 ):
     """
@@ -794,68 +863,7 @@ async def get_model_list(
     返回系統中配置的所有可用模型，可根據提供商進行篩選
     """
     try:
-        models = []
-        
-        # GitHub 模型
-        if not provider or provider.lower() == "github":
-            for model_id in settings.ALLOWED_GITHUB_MODELS:
-                models.append(schemas.ModelInfo(
-                    model_id=model_id,
-                    model_name=model_id,
-                    provider="github",
-                    description="GitHub Models提供的AI模型",
-                    capabilities=["chat", "text-generation"]
-                ))
-        
-        # Gemini 模型
-        if not provider or provider.lower() == "gemini":
-            for model_id in settings.ALLOWED_GEMINI_MODELS:
-                models.append(schemas.ModelInfo(
-                    model_id=model_id,
-                    model_name=model_id,
-                    provider="gemini",
-                    description="Google Gemini AI模型",
-                    capabilities=["chat", "text-generation", "multimodal"]
-                ))
-        
-        # Ollama 模型
-        if not provider or provider.lower() == "ollama":
-            for model_id in settings.ALLOWED_OLLAMA_MODELS:
-                models.append(schemas.ModelInfo(
-                    model_id=model_id,
-                    model_name=model_id,
-                    provider="ollama",
-                    description="Ollama本地AI模型",
-                    capabilities=["chat", "text-generation"]
-                ))
-        
-        # NVIDIA NIM 模型
-        if not provider or provider.lower() == "nvidia_nim":
-            for model_id in settings.ALLOWED_NVIDIA_NIM_MODELS:
-                models.append(schemas.ModelInfo(
-                    model_id=model_id,
-                    model_name=model_id,
-                    provider="nvidia_nim",
-                    description="NVIDIA NIM AI模型",
-                    capabilities=["chat", "text-generation"]
-                ))
-        
-        # OpenRouter 模型
-        if not provider or provider.lower() == "openrouter":
-            for model_id in settings.ALLOWED_OPENROUTER_MODELS:
-                models.append(schemas.ModelInfo(
-                    model_id=model_id,
-                    model_name=model_id,
-                    provider="openrouter",
-                    description="OpenRouter AI模型",
-                    capabilities=["chat", "text-generation"]
-                ))
-        
-        return schemas.ModelListResponse(
-            models=models,
-            total_count=len(models)
-        )
-        
+        return _build_model_list(provider.lower() if provider else None)
     except Exception as e:
         logger.error(f"獲取模型列表失敗: {str(e)}")
         raise HTTPException(
@@ -912,16 +920,10 @@ async def stream_chat(
                 # 目前使用非流式API模擬流式輸出
                 system_prompt = llm_service.get_system_prompt(request.model)
                 
-                # 構建消息
-                messages = []
+                # 構建消息（get_system_prompt 已返回完整的消息字典）
+                messages = [{"role": msg.role, "content": msg.content} for msg in request.messages]
                 if system_prompt:
-                    messages.append({"role": "system", "content": system_prompt})
-                
-                for msg in request.messages:
-                    messages.append({
-                        "role": msg.role,
-                        "content": msg.content
-                    })
+                    messages[:0] = [system_prompt]
                 
                 # 調用LLM服務（非流式）
                 response = await llm_service.chat_completion(
@@ -933,21 +935,19 @@ async def stream_chat(
                 
                 full_response = response.get("message", "")
                 
-                # 將響應按字符分割，模擬流式輸出
-                words = full_response.split()
-                current_content = ""
+                # 按固定長度切片模擬流式輸出（保留原始空白與換行）
+                chunk_size = 32
+                total_length = len(full_response)
                 
-                for i, word in enumerate(words):
-                    current_content += word + " "
-                    
+                for start in range(0, total_length, chunk_size):
                     chunk = schemas.StreamChatChunk(
                         id=response_id,
                         created=created_time,
                         model=request.model,
                         choices=[{
                             "index": 0,
-                            "delta": {"content": word + " "},
-                            "finish_reason": None if i < len(words) - 1 else "stop"
+                            "delta": {"content": full_response[start:start + chunk_size]},
+                            "finish_reason": "stop" if start + chunk_size >= total_length else None
                         }]
                     )
                     
@@ -1231,6 +1231,13 @@ async def get_session_images_list(
             detail=f"获取会话图片列表失败: {str(e)}"
         )
 
+async def _update_smart_title(session_id: str, user_id: str, user_prompt: str, assistant_response: str):
+    """后台生成智能标题并写入会话（generate_smart_title 内部已处理失败回退）"""
+    smart_title = await generate_smart_title(user_prompt, assistant_response)
+    update_session_title(session_id, user_id, smart_title)
+    logger.info(f"已为会话智能生成标题: {smart_title}")
+
+
 # 智能標題生成函數
 async def generate_smart_title(user_prompt: str, assistant_response: str) -> str:
     """
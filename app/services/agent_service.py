@@ -11,23 +11,28 @@ Agent Service - 自主智能代理服務
 
 from typing import List, Dict, Any, Optional, AsyncGenerator, Callable
 import asyncio
-import json
+import logging
+from collections import Counter, OrderedDict, deque
+import orjson
+import random
 import time
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
+from itertools import islice
 import uuid
 
 from app.utils.logger import logger
 from app.core.config import get_settings
 from app.services.llm_service import llm_service
-from app.services.memory_service import memory_service
+from app.services.memory_service import memory_service, memory_update_semaphore
+from app.utils.cache import TTLCache, LLMCache
 from app.utils.tools import (
     assess_task_completion
 )
 from app.models.mongodb import (
     get_chat_logs, 
     update_user_memory, 
-    get_user_memory,
     get_chat_by_interaction_id,
     create_chat_log,
     update_usage
@@ -43,6 +48,37 @@ except ImportError:
 
 settings = get_settings()
 
+# 有副作用的工具（記憶寫入、圖片生成）：其結果與執行計劃都不快取，避免重放時重複執行
+_SIDE_EFFECT_TOOLS = frozenset({"generateImage", "saveToMemory"})
+
+
+@lru_cache(maxsize=2)
+def _system_prompt_for(enable_mcp: bool) -> Dict[str, str]:
+    """按 MCP 開關快取系統提示消息（返回共享字典，調用方不應修改）"""
+    return {
+        "role": "system",
+        "content": settings.PROMPT_REACT_MCP_COMBINED if enable_mcp else settings.PROMPT_REACT_SYSTEM
+    }
+
+
+@lru_cache(maxsize=8)
+def _tools_for(
+    enable_search: bool,
+    include_advanced_tools: bool,
+    enable_mcp: bool,
+    mcp_tool_keys: frozenset
+) -> tuple:
+    """
+    按工具開關快取工具定義
+    
+    MCP 工具可能在運行時變化，因此以當前 MCP 工具鍵集合作為快取鍵的一部分
+    """
+    return tuple(llm_service.get_tool_definitions(
+        enable_search=enable_search,
+        include_advanced_tools=include_advanced_tools,
+        enable_mcp=enable_mcp
+    ))
+
 
 class AgentState(Enum):
     """Agent狀態枚舉"""
@@ -56,48 +92,222 @@ class AgentState(Enum):
     DONE = "done"              # 完成狀態
 
 
-class StreamEvent:
-    """流式事件數據結構"""
-    def __init__(
-        self,
-        status: str,
-        message: str = "",
-        details: Optional[Dict[str, Any]] = None,
-        step: Optional[int] = None,
-        tool_name: Optional[str] = None,
-        tool_result: Optional[str] = None,
-        reasoning: Optional[str] = None,
-        is_final: bool = False
-    ):
-        self.status = status
-        self.message = message
-        self.details = details or {}
-        self.step = step
-        self.tool_name = tool_name
-        self.tool_result = tool_result
-        self.reasoning = reasoning
-        self.is_final = is_final
-        self.timestamp = datetime.now().isoformat()
-    
-    def to_dict(self) -> Dict[str, Any]:
-        return {
-            "status": self.status,
-            "message": self.message,
-            "details": self.details,
-            "step": self.step,
-            "tool_name": self.tool_name,
-            "tool_result": self.tool_result,
-            "reasoning": self.reasoning,
-            "is_final": self.is_final,
-            "timestamp": self.timestamp
-        }
+class _CoalescingStepEmitter:
+    """
+    on_step 回調包裝器：合併高頻的 streaming 事件
+    
+    同一步驟內連續的 streaming 事件會累積文本，距上次推送超過 flush_interval
+    才推送一次；其他事件到達前或模型流結束時（調用方執行 flush）推送累積內容，
+    保證事件順序不變且最後一段文本不被滯留。
+    首段文本立即推送，不影響首 token 延遲。
+    """
+    __slots__ = ("_on_step", "_flush_interval", "_pending", "_last_flush")
+    
+    def __init__(self, on_step: Callable, flush_interval: float):
+        self._on_step = on_step
+        self._flush_interval = flush_interval
+        self._pending: Optional[Dict[str, Any]] = None
+        self._last_flush = 0.0
+    
+    async def __call__(self, event: Dict[str, Any]):
+        if event.get("status") != "streaming":
+            await self.flush()
+            await self._on_step(event)
+            return
+        
+        if self._pending is not None and self._pending.get("step") == event.get("step"):
+            self._pending["message"] += event.get("message", "")
+        else:
+            await self.flush()
+            self._pending = dict(event)
+        
+        if time.monotonic() - self._last_flush >= self._flush_interval:
+            await self.flush()
+    
+    async def flush(self):
+        """推送累積的 streaming 內容"""
+        if self._pending is None:
+            return
+        event, self._pending = self._pending, None
+        self._last_flush = time.monotonic()
+        await self._on_step(event)
+
+
+def _tool_call_signature(tool_call: Dict[str, Any]) -> tuple:
+    """工具調用簽名：(工具名稱, 參數字符串)"""
+    function_call = tool_call.get("function", {})
+    return (function_call.get("name", ""), function_call.get("arguments", "{}"))
+
+
+class _ToolPredictor:
+    """
+    工具調用轉移表
+    
+    記錄成功執行中「上一個工具調用 -> 下一個工具調用」的出現次數，
+    據此預測下一個工具調用，以便在等待 LLM 響應時預取結果。
+    條目數超過上限時淘汰最久未更新的轉移。
+    """
+    
+    def __init__(self, max_entries: int = 512, min_count: int = 2, min_confidence: float = 0.6):
+        self.max_entries = max_entries
+        self.min_count = min_count
+        self.min_confidence = min_confidence
+        self._transitions: "OrderedDict[tuple, Counter]" = OrderedDict()
+    
+    def record(self, sequence: List[tuple]):
+        """記錄一次執行中按順序發生的工具調用簽名"""
+        for prev, nxt in zip(sequence, sequence[1:]):
+            counts = self._transitions.get(prev)
+            if counts is None:
+                counts = self._transitions[prev] = Counter()
+            counts[nxt] += 1
+            self._transitions.move_to_end(prev)
+        while len(self._transitions) > self.max_entries:
+            self._transitions.popitem(last=False)
+    
+    def predict(self, prev: tuple) -> Optional[tuple]:
+        """預測下一個工具調用簽名，次數或佔比不足時返回 None"""
+        counts = self._transitions.get(prev)
+        if not counts:
+            return None
+        nxt, count = counts.most_common(1)[0]
+        if count < self.min_count or count / sum(counts.values()) < self.min_confidence:
+            return None
+        return nxt
+
+
+def _format_args_preview(tool_args: Any) -> str:
+    """生成工具參數的簡短預覽（最多前3個參數，每個值截取30字符）"""
+    try:
+        args_dict = orjson.loads(tool_args) if isinstance(tool_args, str) else tool_args
+        return ", ".join(f"{k}={str(v)[:30]}" for k, v in islice(args_dict.items(), 3))
+    except Exception:
+        return str(tool_args)[:50] if tool_args else ""
+
+
+def _estimate_tokens(message: Dict[str, Any]) -> int:
+    """粗略估算消息的 token 數（與 ensure_content_length 一致按約2字符/token計算，偏保守）"""
+    content = message.get("content") or ""
+    if isinstance(content, list):
+        chars = sum(len(part.get("text", "")) for part in content if isinstance(part, dict))
+    else:
+        chars = len(content)
+    for tool_call in message.get("tool_calls") or ():
+        chars += len(str(tool_call.get("function", {}).get("arguments", "")))
+    return chars // 2 + 4
+
+
+# 上下文裁剪說明中附帶的被省略工具結果摘錄：條數與每條長度
+_OMITTED_EXCERPT_COUNT = 6
+_OMITTED_EXCERPT_CHARS = 120
+
+
+def _prune_to_budget(messages: List[Dict[str, Any]], budget: int, keep_last: int = 4) -> List[Dict[str, Any]]:
+    """
+    按 token 預算裁剪發送給 LLM 的消息列表（返回新列表，不修改原列表）
+    
+    - 保留開頭的系統提示、上下文與第一條用戶消息
+    - 之後的消息按輪次分組（assistant 及其後的 tool 結果為一組），
+      保證 tool_calls 與對應的 tool 消息不會被拆開
+    - 超出預算時從最早的輪次開始省略，至少保留最近 keep_last 組，
+      被省略的輪次以一條系統說明代替，說明中附帶較近幾條被省略工具結果的摘錄，
+      作為早期上下文的簡要摘要（不額外調用 LLM）
+    """
+    token_counts = [_estimate_tokens(message) for message in messages]
+    if sum(token_counts) <= budget:
+        return messages
+    
+    head_end = next((i + 1 for i, message in enumerate(messages) if message.get("role") == "user"), 0)
+    
+    # 將其餘消息按輪次分組：每組以非 tool 消息開始
+    groups: List[List[int]] = []
+    for i in range(head_end, len(messages)):
+        if messages[i].get("role") != "tool" or not groups:
+            groups.append([i])
+        else:
+            groups[-1].append(i)
+    
+    total = sum(token_counts)
+    dropped = 0
+    omitted_tools = []
+    while len(groups) - dropped > keep_last and total > budget:
+        for i in groups[dropped]:
+            total -= token_counts[i]
+            if messages[i].get("role") == "tool":
+                omitted_tools.append(messages[i])
+        dropped += 1
+    
+    if dropped == 0:
+        return messages
+    
+    omitted_count = sum(len(group) for group in groups[:dropped])
+    note = f"[已省略 {omitted_count} 條較早的消息以控制上下文長度"
+    if omitted_tools:
+        tool_names = dict.fromkeys(message.get("name", "") for message in omitted_tools)
+        note += f"，其中包含工具結果: {', '.join(tool_names)}"
+    note += "]"
+    # 附帶最近幾條被省略工具結果的開頭，保留早期觀察的要點
+    for message in omitted_tools[-_OMITTED_EXCERPT_COUNT:]:
+        content = message.get("content")
+        if isinstance(content, str) and content:
+            note += f"\n- {message.get('name', '')}: {_preview(content, _OMITTED_EXCERPT_CHARS)}"
+    
+    pruned = messages[:head_end]
+    pruned.append({"role": "system", "content": note})
+    for group in groups[dropped:]:
+        pruned.extend(messages[i] for i in group)
+    return pruned
+
+
+def _compact_trace(execution_trace: List[Dict[str, Any]], max_entries: int) -> List[Dict[str, Any]]:
+    """
+    構建返回給調用方的精簡執行軌跡
+    
+    只保留最近 max_entries 條；tool_calls / tool_results 替換為工具名稱與長度摘要
+    （完整內容已在 tools_used 與 reasoning_steps 中以摘錄形式提供）。
+    運行期間的完整軌跡不受影響，執行計劃快取與工具預取仍從中讀取。
+    """
+    compacted = []
+    for entry in execution_trace[-max_entries:]:
+        if "tool_calls" in entry or "tool_results" in entry:
+            entry = dict(entry)
+            if entry.get("tool_calls"):
+                entry["tool_calls"] = [
+                    {
+                        "name": tc.get("function", {}).get("name", ""),
+                        "arguments_chars": len(tc.get("function", {}).get("arguments") or "")
+                    }
+                    for tc in entry["tool_calls"]
+                ]
+            if entry.get("tool_results"):
+                entry["tool_results"] = [
+                    {
+                        "name": tool_result.get("name", ""),
+                        "content_chars": len(tool_result.get("content") or ""),
+                        "cached": tool_result.get("cached", False)
+                    }
+                    for tool_result in entry["tool_results"]
+                ]
+        compacted.append(entry)
+    return compacted
+
+
+def _now_iso() -> str:
+    """當前本地時間的 ISO 格式字符串（執行軌跡、推理步驟的時間戳）"""
+    return datetime.now().isoformat()
+
+
+def _preview(text: str, limit: int) -> str:
+    """截取預覽文本，超出長度時附加省略號（未超出時直接返回原字符串，不複製）"""
+    return text if len(text) <= limit else text[:limit] + "..."
 
 
 # 記憶更新的後台任務函數
 async def background_memory_update(user_id: str, prompt: str):
-    """後台異步更新用戶記憶"""
+    """後台異步更新用戶記憶（通過信號量限制並發數）"""
     try:
-        await memory_service.update_memory(user_id, prompt)
+        async with memory_update_semaphore:
+            await memory_service.update_memory(user_id, prompt)
         logger.info(f"後台記憶更新任務已完成，用戶ID: {user_id}")
     except Exception as e:
         logger.error(f"後台記憶更新任務失敗，用戶ID: {user_id}, 錯誤: {str(e)}")
@@ -127,6 +337,44 @@ class AgentService:
         self.enable_ground_truth_validation = getattr(settings, 'AGENT_ENABLE_GROUND_TRUTH', True)  # Ground Truth 驗證
         self.enable_dynamic_reflection = getattr(settings, 'AGENT_ENABLE_DYNAMIC_REFLECTION', True)  # 動態反思
         self.enable_self_evaluation = getattr(settings, 'AGENT_ENABLE_SELF_EVALUATION', True)  # 自我評估/完成度評估
+        self.tool_timeout_threshold = getattr(settings, 'AGENT_TOOL_TIMEOUT_THRESHOLD', 10000)  # 觸發反思的工具耗時（毫秒）
+        self.auto_save_memory = getattr(settings, 'AGENT_AUTO_SAVE_MEMORY', True)  # 是否自動保存記憶
+        self.reflection_message = settings.PROMPT_REFLECTION_MESSAGE  # 反思提示
+        self.context_budget = getattr(settings, 'AGENT_CONTEXT_BUDGET_TOKENS', 24000)  # 每次請求的上下文預算（估算 token）
+        self.context_keep_last = getattr(settings, 'AGENT_CONTEXT_KEEP_LAST', 4)  # 裁剪時至少保留的最近輪次
+        self.local_summary = getattr(settings, 'AGENT_LOCAL_SUMMARY', False)  # 達到最大步驟數時直接拼接推理步驟作為總結
+        self.summary_model = getattr(settings, 'AGENT_SUMMARY_MODEL', "")  # 最大步驟總結使用的模型，空字符串表示當前模型
+        self.trace_verbose = getattr(settings, 'AGENT_TRACE_VERBOSE', False)  # 返回完整執行軌跡（含工具參數與結果全文）
+        self.trace_max_entries = getattr(settings, 'AGENT_TRACE_MAX_ENTRIES', 200)  # 精簡軌跡最多返回的條目數
+        self._rate_limit_until: Dict[str, float] = {}  # 各模型速率限制冷卻結束時間（monotonic）
+        self._llm_semaphore = asyncio.Semaphore(getattr(settings, 'AGENT_MAX_CONCURRENT_LLM', 8))  # LLM 並發請求上限
+        self._background_tasks: set = set()  # 進行中的背景任務（使用統計寫入、記憶更新等）
+        self._active_memory_users: set = set()  # 正在更新記憶的用戶ID，避免同一用戶重複排程
+        self._pending_memory_prompts: Dict[str, List[str]] = {}  # 更新進行中時到達的提示，完成後合併為一次更新
+        
+        # 執行計劃快取：相同請求（用戶、模型、提示、工具集合）的工具調用序列
+        self.plan_cache = None
+        if getattr(settings, 'AGENT_ENABLE_PLAN_CACHE', False):
+            self.plan_cache = TTLCache(max_entries=256, ttl=getattr(settings, 'AGENT_PLAN_CACHE_TTL', 3600))
+        
+        # 完整回覆快取：相同請求在有效期內直接返回上次的最終回覆
+        self.response_cache = None
+        if getattr(settings, 'AGENT_ENABLE_RESPONSE_CACHE', False):
+            self.response_cache = TTLCache(max_entries=256, ttl=getattr(settings, 'AGENT_RESPONSE_CACHE_TTL', 300))
+        
+        # 工具預取：依歷史工具調用序列預測下一個工具，預取結果寫入工具快取（需啟用工具快取）
+        self.tool_predictor = None
+        if getattr(settings, 'AGENT_ENABLE_TOOL_PREFETCH', False) and llm_service.tool_cache is not None:
+            self.tool_predictor = _ToolPredictor()
+        
+        # LLM 響應快取（進程內 LRU + TTL）
+        self.temperature = getattr(settings, 'AGENT_TEMPERATURE', None)  # 生成溫度，None 使用 Provider 默認值
+        self.llm_cache = None
+        if getattr(settings, 'AGENT_ENABLE_LLM_CACHE', False):
+            self.llm_cache = LLMCache(TTLCache(
+                max_entries=getattr(settings, 'AGENT_CACHE_MAX_ENTRIES', 256),
+                ttl=getattr(settings, 'AGENT_CACHE_TTL', 600)
+            ))
     
     def _get_system_prompt(self, enable_mcp: bool = True) -> Dict[str, str]:
         """
@@ -138,16 +386,7 @@ class AgentService:
         Returns:
             系統提示字典
         """
-        if enable_mcp:
-            return {
-                "role": "system",
-                "content": settings.PROMPT_REACT_MCP_COMBINED
-            }
-        else:
-            return {
-                "role": "system",
-                "content": settings.PROMPT_REACT_SYSTEM
-            }
+        return _system_prompt_for(bool(enable_mcp))
     
     async def _check_mcp_availability(self, enable_mcp: bool) -> bool:
         """檢查 MCP 客戶端是否可用"""
@@ -167,12 +406,57 @@ class AgentService:
             logger.warning(f"MCP客戶端不可用: {e}")
             return False
     
-    async def _update_usage_stats(self, user_id: str, model_name: str):
-        """更新用戶使用統計"""
-        update_usage(user_id, model_name)
-        current_date = datetime.now().strftime("%Y-%m-%d")
-        update_usage_sqlite(user_id, model_name, current_date)
-        logger.debug(f"已更新用戶 {user_id} 使用 {model_name} 的統計")
+    def _update_usage_stats_sync(self, user_id: str, model_name: str, count: int = 1):
+        """更新用戶使用統計（阻塞的 MongoDB/SQLite 寫入，在執行緒中運行）"""
+        try:
+            update_usage(user_id, model_name, count)
+            current_date = datetime.now().strftime("%Y-%m-%d")
+            update_usage_sqlite(user_id, model_name, current_date, count)
+            logger.debug(f"已更新用戶 {user_id} 使用 {model_name} 的統計")
+        except Exception as e:
+            logger.warning(f"更新用戶使用統計失敗: {str(e)}")
+    
+    def _update_usage_stats(self, user_id: str, model_name: str, count: int = 1):
+        """在背景執行緒中更新用戶使用統計，不阻塞 Agent 主循環（只排程，無需 await）"""
+        self._spawn_background(asyncio.to_thread(self._update_usage_stats_sync, user_id, model_name, count))
+    
+    def _spawn_background(self, coro) -> asyncio.Task:
+        """啟動背景任務並保留引用，避免未完成的任務被垃圾回收"""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+    
+    async def drain_background_tasks(self, timeout: float):
+        """等待進行中的背景任務（聊天記錄、記憶更新、使用統計）完成，超時後取消其餘任務"""
+        if not self._background_tasks:
+            return
+        _, pending = await asyncio.wait(set(self._background_tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            logger.warning(f"關閉時仍有 {len(pending)} 個背景任務未完成，已取消")
+    
+    async def _guarded_memory_update(self, user_id: str, prompt: str):
+        """
+        同一用戶同時只保留一個記憶更新任務
+        
+        更新進行中時到達的提示先暫存，當前更新完成後按到達順序合併，
+        以一次 LLM 調用批量更新，避免突發請求時逐條調用
+        """
+        if user_id in self._active_memory_users:
+            self._pending_memory_prompts.setdefault(user_id, []).append(prompt)
+            logger.info(f"用戶 {user_id} 已有進行中的記憶更新，本次提示將合併到下一批")
+            return
+        self._active_memory_users.add(user_id)
+        try:
+            while prompt is not None:
+                await background_memory_update(user_id, prompt)
+                pending = self._pending_memory_prompts.pop(user_id, None)
+                prompt = "\n".join(pending) if pending else None
+        finally:
+            self._active_memory_users.discard(user_id)
+            self._pending_memory_prompts.pop(user_id, None)
     
     async def _send_request_with_retry(
         self,
@@ -180,17 +464,22 @@ class AgentService:
         model_name: str,
         tools: Optional[List[Dict[str, Any]]] = None,
         on_step: Optional[Callable] = None,
-        max_retries: Optional[int] = None
+        max_retries: Optional[int] = None,
+        step: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         發送 LLM 請求，支持自動重試
         
+        啟用 AGENT_STREAM_TOKENS 時，模型輸出的每段文本會即時以
+        status="streaming" 事件推送，完整響應仍在流結束後返回
+        
         Args:
             messages: 消息列表
             model_name: 模型名稱
             tools: 工具定義
             on_step: 步驟回調函數
             max_retries: 最大重試次數（默認使用配置值）
+            step: 當前步驟編號（用於流式事件）
             
         Returns:
             LLM 響應
@@ -199,32 +488,127 @@ class AgentService:
         if max_retries is None:
             max_retries = getattr(settings, 'AGENT_MAX_LLM_RETRIES', 3)
         
+        # 檢查響應快取（相同模型、消息與工具集合；採樣請求不讀寫快取）
+        cache_key = None
+        if self.llm_cache is not None:
+            cache_key = self.llm_cache.make_key(model_name, messages, tools, self.temperature)
+            cached_response = self.llm_cache.get(cache_key) if cache_key else None
+            if cached_response is not None:
+                logger.debug(f"LLM響應快取命中: {cache_key[:12]}")
+                if on_step:
+                    await on_step({
+                        "status": "cache_hit",
+                        "message": "命中響應快取，跳過模型請求",
+                        "details": self.llm_cache.stats
+                    })
+                return cached_response
+        
+        # 逐段推送模型輸出
+        # 每段文本復用同一個事件字典（原地更新 message）；
+        # 約定 on_step 對 streaming 事件只讀取、不保留引用（_CoalescingStepEmitter 會自行複製）
+        on_delta = None
+        if on_step and getattr(settings, 'AGENT_STREAM_TOKENS', True):
+            delta_event = {"status": "streaming", "message": "", "step": step}
+            
+            async def on_delta(text: str):
+                delta_event["message"] = text
+                await on_step(delta_event)
+        
+        # 僅在配置了溫度時傳遞，否則沿用各 Provider 默認值
+        request_kwargs = {"temperature": self.temperature} if self.temperature is not None else {}
+        
         retry_count = 0
+        announced_until = 0.0  # 本次調用已通知客戶端的冷卻結束時間（重試事件已包含等待時間）
         while retry_count <= max_retries:
+            # 模型仍在速率限制冷卻期內時，先等待冷卻結束再發送請求
+            cooldown_until = self._rate_limit_until.get(model_name, 0)
+            cooldown = cooldown_until - time.monotonic()
+            if cooldown > 0:
+                # 僅當冷卻由其他並發執行設置或延長時才提示，本次重試設置的冷卻已在重試事件中通知
+                if on_step and cooldown_until > announced_until:
+                    await on_step({
+                        "status": "waiting",
+                        "message": f"模型速率限制冷卻中，{cooldown:.1f}秒後發送請求...",
+                        "details": {"wait_time": round(cooldown, 1)}
+                    })
+                await asyncio.sleep(cooldown)
+            
             try:
-                response = await llm_service.send_llm_request(messages, model_name, tools)
-                return response
+                async with self._llm_semaphore:
+                    response = await llm_service.send_llm_request(messages, model_name, tools, on_delta=on_delta, **request_kwargs)
             except Exception as e:
+                if not self._is_rate_limit_error(e):
+                    logger.error(f"LLM請求異常: {str(e)}")
+                    raise
+                retry_after = self._get_retry_after(e)
                 err_str = str(e)
-                if '429' in err_str or 'Rate limit' in err_str or 'Too Many Requests' in err_str:
-                    retry_count += 1
-                    wait_time = 60 * retry_count  # 遞增等待時間
-                    logger.warning(f"速率限制，第{retry_count}次重試，等待{wait_time}秒: {err_str}")
-                    
-                    if on_step:
-                        await on_step(StreamEvent(
-                            status="waiting",
-                            message=f"模型速率限制，等待{wait_time}秒後自動重試... (第{retry_count}次)",
-                            details={"retry_count": retry_count, "wait_time": wait_time}
-                        ).to_dict())
-                    
-                    await asyncio.sleep(wait_time)
-                    continue
+            else:
+                # 流式 Provider 以錯誤響應（而非異常）返回上游 HTTP 錯誤，按狀態碼識別速率限制
+                if "error" in response and response.get("status_code") == 429:
+                    retry_after = self._parse_retry_after(response.get("retry_after"))
+                    err_str = response.get("detail") or response.get("error")
                 else:
-                    logger.error(f"LLM請求異常: {err_str}")
-                    raise
+                    # 只快取成功的響應
+                    if cache_key and "error" not in response:
+                        self.llm_cache.set(cache_key, response)
+                    return response
+            finally:
+                # 流結束時立即推送合併器中累積的最後一段文本，不必等到下一個事件
+                if on_delta is not None and isinstance(on_step, _CoalescingStepEmitter):
+                    await on_step.flush()
+            
+            retry_count += 1
+            # 優先使用服務端 Retry-After，否則指數退避加隨機抖動，避免並發請求同步重試
+            wait_time = retry_after
+            if wait_time is None:
+                wait_time = min(
+                    settings.AGENT_RETRY_BASE_S * 2 ** (retry_count - 1)
+                    + random.uniform(0, settings.AGENT_RETRY_JITTER_S),
+                    settings.AGENT_RETRY_CAP_S
+                )
+            wait_time = round(wait_time, 1)
+            announced_until = time.monotonic() + wait_time
+            self._rate_limit_until[model_name] = announced_until
+            logger.warning(f"速率限制，第{retry_count}次重試，等待{wait_time}秒: {err_str}")
+            
+            if on_step:
+                await on_step({
+                    "status": "waiting",
+                    "message": f"模型速率限制，等待{wait_time}秒後自動重試... (第{retry_count}次)",
+                    "details": {"retry_count": retry_count, "wait_time": wait_time}
+                })
         
         raise Exception(f"已達到最大重試次數 ({max_retries})")
+    
+    @staticmethod
+    def _is_rate_limit_error(error: Exception) -> bool:
+        """判斷異常是否為速率限制：優先按 HTTP 狀態碼，無狀態碼時才退回字符串匹配"""
+        status_code = getattr(error, "status_code", None)
+        if status_code is None:
+            status_code = getattr(getattr(error, "response", None), "status_code", None)
+        if isinstance(status_code, int):
+            return status_code == 429
+        err_str = str(error)
+        return '429' in err_str or 'Rate limit' in err_str or 'Too Many Requests' in err_str
+    
+    @staticmethod
+    def _parse_retry_after(value: Any) -> Optional[float]:
+        """解析 Retry-After（秒），不存在或無法解析時返回 None"""
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    
+    @classmethod
+    def _get_retry_after(cls, error: Exception) -> Optional[float]:
+        """從異常附帶的 HTTP 響應中讀取 Retry-After（秒），不存在或無法解析時返回 None"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+        return cls._parse_retry_after(headers.get("retry-after"))
 
     async def run(
         self, 
@@ -274,9 +658,14 @@ class AgentService:
         # 重置狀態
         llm_service.last_generated_image = None
         
+        # 合併高頻 streaming 事件，減少回調與 SSE 寫出次數
+        # （done/error 等終止事件會先推送累積內容）
+        if on_step:
+            on_step = _CoalescingStepEmitter(on_step, getattr(settings, 'AGENT_STREAM_FLUSH_INTERVAL', 0.033))
+        
         # 生成交互ID
         interaction_id = str(uuid.uuid4())
-        start_time = time.time()
+        start_time = time.perf_counter()
         steps_taken = 0
         max_steps_limit = max_steps if max_steps is not None else self.max_steps
         
@@ -284,12 +673,27 @@ class AgentService:
         execution_trace = []
         reasoning_steps = []
         tools_used = []
+        trace_append = execution_trace.append
+        reasoning_append = reasoning_steps.append
         
         # Anthropic 最佳實踐：多樣化停止條件追蹤
         consecutive_failures = 0  # 連續失敗計數
         last_tool_results = []  # 上次工具結果（用於檢測重複）
-        tool_result_history = []  # 工具結果歷史（用於檢測循環）
+        # 每次請求的上下文預算
+        context_budget = self.context_budget
+        context_keep_last = self.context_keep_last
+        
+        # 工具結果簽名的滑動窗口與計數（用於 O(1) 檢測循環）
+        loop_detection_window = getattr(settings, 'AGENT_LOOP_DETECTION_WINDOW', 3)
+        tool_result_history = deque(maxlen=loop_detection_window)
+        tool_signature_counts = Counter()
         task_completion_confidence = 0.0  # 任務完成信心度
+        llm_calls = 0  # 本次執行的 LLM 請求數，結束時一次性寫入使用統計
+        tool_predictor = self.tool_predictor
+        prefetch_task: Optional[asyncio.Task] = None  # 與 LLM 請求並行的工具預取任務
+        prefetch_signature = None  # 預取的工具調用簽名
+        prefetch_attempts = 0
+        prefetch_hits = 0
         
         # 處理工具配置
         enable_search = True
@@ -301,15 +705,15 @@ class AgentService:
         try:
             # 發送初始化事件
             if on_step:
-                await on_step(StreamEvent(
-                    status="initializing",
-                    message="正在初始化智能代理...",
-                    details={"prompt": prompt, "model": model_name}
-                ).to_dict())
+                await on_step({
+                    "status": "initializing",
+                    "message": "正在初始化智能代理...",
+                    "details": {"prompt": prompt, "model": model_name}
+                })
             
             # 記錄初始化
-            execution_trace.append({
-                "timestamp": datetime.now().isoformat(),
+            trace_append({
+                "timestamp": _now_iso(),
                 "state": AgentState.IDLE.value,
                 "action": "初始化Agent",
                 "context": {
@@ -326,18 +730,27 @@ class AgentService:
                 enable_mcp = False
                 logger.info("MCP不可用，已禁用MCP功能")
             
-            # 獲取記憶（如果啟用）
-            memory_content = ""
+            # 讀取記憶（如果啟用）與格式化用戶輸入互不依賴，並發進行
+            user_message_coro = llm_service.format_user_message(
+                prompt=prompt,
+                image=image,
+                audio=audio,
+                model_name=model_name
+            )
             if enable_memory:
-                memory = get_user_memory(user_id)
-                if memory:
-                    memory_content = memory
-                    if on_step:
-                        await on_step(StreamEvent(
-                            status="memory",
-                            message="已載入用戶記憶",
-                            details={"memory_length": len(memory)}
-                        ).to_dict())
+                memory_content, user_message = await asyncio.gather(
+                    memory_service.get_memory(user_id), user_message_coro
+                )
+                memory_content = memory_content or ""
+                if memory_content and on_step:
+                    await on_step({
+                        "status": "memory",
+                        "message": "已載入用戶記憶",
+                        "details": {"memory_length": len(memory_content)}
+                    })
+            else:
+                memory_content = ""
+                user_message = await user_message_coro
             
             # 組裝初始消息
             system_prompt = system_prompt_override if system_prompt_override else self._get_system_prompt(enable_mcp)
@@ -355,36 +768,70 @@ class AgentService:
                 })
             
             # 添加用戶輸入
-            user_message = await llm_service.format_user_message(
-                prompt=prompt,
-                image=image,
-                audio=audio,
-                model_name=model_name
-            )
             messages.extend(user_message)
             
-            # 獲取工具定義
-            tools = llm_service.get_tool_definitions(
-                enable_search=enable_search,
-                include_advanced_tools=include_advanced_tools,
-                enable_mcp=enable_mcp
-            )
+            # 獲取工具定義（按工具開關與 MCP 工具集合快取）
+            mcp_tool_keys = frozenset(mcp_client.get_available_tools()) if enable_mcp and mcp_client else frozenset()
+            tools = list(_tools_for(
+                bool(enable_search),
+                bool(include_advanced_tools),
+                bool(enable_mcp),
+                mcp_tool_keys
+            ))
             
             # 發送思考開始事件
             if on_step:
-                await on_step(StreamEvent(
-                    status="thinking",
-                    message="開始分析任務...",
-                    step=0
-                ).to_dict())
+                await on_step({
+                    "status": "thinking",
+                    "message": "開始分析任務...",
+                    "step": 0
+                })
             
-            # 主執行循環 - LLM 自主決策
             final_response = None
             stop_reason = None  # 記錄停止原因
             
-            while steps_taken < max_steps_limit:
+            # 完整回覆快取：相同請求（用戶、模型、提示、工具集合）直接返回上次的最終回覆
+            cacheable_request = not (image or audio or system_prompt_override or additional_context)
+            response_key = None
+            if self.response_cache is not None and cacheable_request:
+                response_key = self._plan_cache_key(user_id, model_name, prompt, tools)
+                cached_content = self.response_cache.get(response_key)
+                if cached_content is not None:
+                    final_response = {
+                        "choices": [{
+                            "message": {"role": "assistant", "content": cached_content},
+                            "finish_reason": "stop"
+                        }]
+                    }
+                    stop_reason = "response_cache"
+                    trace_append({
+                        "timestamp": _now_iso(),
+                        "state": AgentState.RESPONDING.value,
+                        "action": "回覆快取命中，直接返回上次的回覆"
+                    })
+            
+            # 執行計劃快取：相同請求直接重放上次成功的工具調用序列，失敗時回退到正常循環
+            plan_key = None
+            if final_response is None and self.plan_cache is not None and cacheable_request:
+                plan_key = self._plan_cache_key(user_id, model_name, prompt, tools)
+                cached_plan = self.plan_cache.get(plan_key)
+                if cached_plan:
+                    replay = await self._replay_plan(cached_plan, messages, model_name, user_id, on_step)
+                    if replay is not None:
+                        final_response, replayed_tools = replay
+                        tools_used.extend(replayed_tools)
+                        steps_taken = len(cached_plan) + 1
+                        stop_reason = "plan_replay"
+                        trace_append({
+                            "timestamp": _now_iso(),
+                            "state": AgentState.RESPONDING.value,
+                            "action": f"重放執行計劃（{len(cached_plan)} 步工具調用）"
+                        })
+            
+            # 主執行循環 - LLM 自主決策
+            while final_response is None and steps_taken < max_steps_limit:
                 steps_taken += 1
-                current_time = time.time()
+                current_time = time.perf_counter()
                 
                 # === 多樣化停止條件 ===
                 
@@ -393,11 +840,11 @@ class AgentService:
                     stop_reason = "execution_timeout"
                     logger.warning(f"Agent 執行超時 ({self.max_execution_time}秒)")
                     if on_step:
-                        await on_step(StreamEvent(
-                            status="timeout",
-                            message=f"執行時間超過 {self.max_execution_time} 秒，正在生成總結...",
-                            step=steps_taken
-                        ).to_dict())
+                        await on_step({
+                            "status": "timeout",
+                            "message": f"執行時間超過 {self.max_execution_time} 秒，正在生成總結...",
+                            "step": steps_taken
+                        })
                     break
                 
                 # 停止條件 2: 連續失敗過多
@@ -405,53 +852,57 @@ class AgentService:
                     stop_reason = "consecutive_failures"
                     logger.warning(f"Agent 連續失敗 {consecutive_failures} 次，停止執行")
                     if on_step:
-                        await on_step(StreamEvent(
-                            status="error",
-                            message=f"連續失敗 {consecutive_failures} 次，正在生成總結...",
-                            step=steps_taken
-                        ).to_dict())
+                        await on_step({
+                            "status": "error",
+                            "message": f"連續失敗 {consecutive_failures} 次，正在生成總結...",
+                            "step": steps_taken
+                        })
                     break
                 
                 # 停止條件 3: 檢測到循環（重複相同工具調用）
-                loop_detection_window = getattr(settings, 'AGENT_LOOP_DETECTION_WINDOW', 3)
-                if len(tool_result_history) >= loop_detection_window:
-                    recent_results = tool_result_history[-loop_detection_window:]
-                    if len(set(str(r) for r in recent_results)) == 1:
+                if loop_detection_window > 0 and len(tool_result_history) == loop_detection_window:
+                    # 窗口已滿且最新簽名佔滿整個窗口，即最近結果全部相同
+                    if tool_signature_counts[tool_result_history[-1]] == loop_detection_window:
                         stop_reason = "loop_detected"
                         logger.warning("檢測到工具調用循環，停止執行")
                         if on_step:
-                            await on_step(StreamEvent(
-                                status="loop_detected",
-                                message="檢測到重複操作模式，正在生成總結...",
-                                step=steps_taken
-                            ).to_dict())
+                            await on_step({
+                                "status": "loop_detected",
+                                "message": "檢測到重複操作模式，正在生成總結...",
+                                "step": steps_taken
+                            })
                         break
                 
                 # 發送步驟開始事件
                 if on_step:
-                    await on_step(StreamEvent(
-                        status="thinking",
-                        message=f"第 {steps_taken} 步推理中...",
-                        step=steps_taken,
-                        details={
+                    await on_step({
+                        "status": "thinking",
+                        "message": f"第 {steps_taken} 步推理中...",
+                        "step": steps_taken,
+                        "details": {
                             "elapsed_time": round(current_time - start_time, 2),
                             "consecutive_failures": consecutive_failures
                         }
-                    ).to_dict())
+                    })
                 
-                # 更新使用統計
-                await self._update_usage_stats(user_id, model_name)
+                # 累計使用統計（執行結束時統一寫入）
+                llm_calls += 1
                 
                 # 發送 LLM 請求
+                # 按上下文預算裁剪本次請求的消息（完整歷史仍保留在 messages 中）
+                request_messages = _prune_to_budget(messages, context_budget, context_keep_last)
                 response = await self._send_request_with_retry(
-                    messages, model_name, tools, on_step
+                    request_messages, model_name, tools, on_step, step=steps_taken
                 )
                 
+                # 本步驟收到響應時刻的時間戳，供響應階段的各條記錄共用
+                response_ts = _now_iso()
+                
                 # 檢查響應是否有效
                 if "error" in response:
                     logger.error(f"LLM響應錯誤: {response}")
-                    execution_trace.append({
-                        "timestamp": datetime.now().isoformat(),
+                    trace_append({
+                        "timestamp": response_ts,
                         "state": AgentState.ERROR.value,
                         "action": "LLM響應錯誤",
                         "error": response.get("error")
@@ -469,118 +920,130 @@ class AgentService:
                 
                 # 記錄思考內容
                 if content:
-                    reasoning_steps.append({
+                    reasoning_append({
                         "type": "thought",
                         "title": f"思考 #{steps_taken}",
                         "content": content,
-                        "timestamp": datetime.now().isoformat()
+                        "timestamp": response_ts
                     })
                     
                     if on_step:
-                        await on_step(StreamEvent(
-                            status="thinking",
-                            message=content,
-                            reasoning=content,
-                            step=steps_taken
-                        ).to_dict())
+                        await on_step({
+                            "status": "thinking",
+                            "message": content,
+                            "reasoning": content,
+                            "step": steps_taken
+                        })
+                
+                # 核對工具預取：預測命中時等待預取完成，下方 handle_tool_call 直接命中工具快取
+                if prefetch_task is not None:
+                    if tool_calls and any(_tool_call_signature(tc) == prefetch_signature for tc in tool_calls):
+                        await prefetch_task
+                        prefetch_hits += 1
+                    else:
+                        prefetch_task.cancel()
+                    prefetch_task = None
                 
                 # 檢查是否有工具調用
                 if tool_calls and len(tool_calls) > 0:
                     # 記錄執行狀態
-                    execution_trace.append({
-                        "timestamp": datetime.now().isoformat(),
+                    trace_append({
+                        "timestamp": response_ts,
                         "state": AgentState.EXECUTING.value,
                         "action": f"執行工具調用 (步驟 {steps_taken})",
                         "tool_calls": tool_calls
                     })
                     
                     # 將助理回覆添加到消息歷史
-                    assistant_msg = {
-                        "role": "assistant",
-                        "content": content,
-                        "tool_calls": tool_calls
-                    }
-                    messages.append(assistant_msg)
+                    # collect_stream_response 構建的 message 已是 {role, content, tool_calls}，直接引用，不重建字典
+                    messages.append(message)
                     
                     # 詳細記錄 tool_calls 的 ID
-                    logger.debug(f"[Agent] 添加 assistant 消息，包含 {len(tool_calls)} 個 tool_calls:")
-                    for tc in tool_calls:
-                        logger.debug(f"  - tool_call_id: {tc.get('id')}, name: {tc.get('function', {}).get('name')}")
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug(f"[Agent] 添加 assistant 消息，包含 {len(tool_calls)} 個 tool_calls:")
+                        for tc in tool_calls:
+                            logger.debug(f"  - tool_call_id: {tc.get('id')}, name: {tc.get('function', {}).get('name')}")
                     
-                    # 發送工具調用事件
-                    for tc in tool_calls:
-                        tool_name = tc.get("function", {}).get("name", "unknown")
-                        tool_args = tc.get("function", {}).get("arguments", "{}")
-                        
-                        # 解析參數以生成更好的描述
-                        try:
-                            args_dict = json.loads(tool_args) if isinstance(tool_args, str) else tool_args
-                            args_preview = ", ".join([f"{k}={str(v)[:30]}" for k, v in args_dict.items()][:3])
-                        except:
-                            args_preview = tool_args[:50] if tool_args else ""
-                        
-                        if on_step:
-                            await on_step(StreamEvent(
-                                status="executing",
-                                message=f"正在執行工具: {tool_name}",
-                                tool_name=tool_name,
-                                reasoning=f"決定調用工具 {tool_name}({args_preview})",
-                                details={"arguments": tool_args},
-                                step=steps_taken
-                            ).to_dict())
+                    # 發送工具調用事件（無回調時無需生成參數預覽）
+                    if on_step:
+                        for tc in tool_calls:
+                            tool_name = tc.get("function", {}).get("name", "unknown")
+                            tool_args = tc.get("function", {}).get("arguments", "{}")
+                            args_preview = _format_args_preview(tool_args)
+                            
+                            await on_step({
+                                "status": "executing",
+                                "message": f"正在執行工具: {tool_name}",
+                                "tool_name": tool_name,
+                                "reasoning": f"決定調用工具 {tool_name}({args_preview})",
+                                "details": {"arguments": tool_args},
+                                "step": steps_taken
+                            })
                     
                     # 執行工具調用（記錄執行時間）
-                    tool_start_time = time.time()
+                    tool_start_time = time.perf_counter()
                     tool_results = await llm_service.handle_tool_call(tool_calls)
-                    tool_duration = int((time.time() - tool_start_time) * 1000)  # 轉換為毫秒
+                    tool_duration = int((time.perf_counter() - tool_start_time) * 1000)  # 轉換為毫秒
                     
-                    # 記錄觀察結果
-                    execution_trace.append({
-                        "timestamp": datetime.now().isoformat(),
+                    # 記錄觀察結果（工具執行結束時刻的時間戳，供本批工具結果的各條記錄共用）
+                    observed_ts = _now_iso()
+                    trace_append({
+                        "timestamp": observed_ts,
                         "state": AgentState.OBSERVING.value,
                         "action": f"觀察工具結果 (步驟 {steps_taken})",
                         "tool_results": tool_results,
                         "duration_ms": tool_duration
                     })
                     
-                    # 將工具結果添加到消息歷史
-                    for tool_result in tool_results:
-                        tool_msg = {
+                    # 將工具結果添加到消息歷史（content 以引用共享，不複製字符串）
+                    messages.extend(
+                        {
                             "role": "tool",
                             "tool_call_id": tool_result["tool_call_id"],
                             "name": tool_result["name"],
                             "content": tool_result["content"]
                         }
-                        messages.append(tool_msg)
-                        logger.debug(f"[Agent] 添加 tool 消息，tool_call_id: {tool_result['tool_call_id']}, name: {tool_result['name']}")
+                        for tool_result in tool_results
+                    )
+                    if logger.isEnabledFor(logging.DEBUG):
+                        for tool_result in tool_results:
+                            logger.debug(f"[Agent] 添加 tool 消息，tool_call_id: {tool_result['tool_call_id']}, name: {tool_result['name']}")
+                    
+                    for tool_result in tool_results:
+                        # 各長度的預覽只計算一次，供下方各記錄共用
+                        tool_name = tool_result["name"]
+                        tool_content = tool_result["content"]
+                        result_excerpt = tool_content[:500]
+                        result_preview = _preview(tool_content, 300)
                         
                         # 記錄工具使用（添加 duration 字段）
                         tools_used.append({
-                            "name": tool_result["name"],
-                            "result": tool_result["content"][:500] if len(tool_result["content"]) > 500 else tool_result["content"],
+                            "name": tool_name,
+                            "result": result_excerpt,
                             "duration": tool_duration,  # 添加執行時間（毫秒）
-                            "timestamp": datetime.now().isoformat()
+                            "cached": tool_result.get("cached", False),  # 是否來自工具結果快取
+                            "timestamp": observed_ts
                         })
                         
                         # 記錄行動步驟
-                        reasoning_steps.append({
+                        reasoning_append({
                             "type": "action",
-                            "title": f"行動 #{steps_taken}: {tool_result['name']}",
-                            "content": f"工具: {tool_result['name']}\n結果: {tool_result['content'][:300]}{'...' if len(tool_result['content']) > 300 else ''}",
-                            "tool": tool_result["name"],
-                            "result": tool_result["content"][:300] + ("..." if len(tool_result["content"]) > 300 else ""),
-                            "timestamp": datetime.now().isoformat()
+                            "title": f"行動 #{steps_taken}: {tool_name}",
+                            "content": f"工具: {tool_name}\n結果: {result_preview}",
+                            "tool": tool_name,
+                            "result": result_preview,
+                            "timestamp": observed_ts
                         })
                         
                         if on_step:
-                            await on_step(StreamEvent(
-                                status="observing",
-                                message=f"工具 {tool_result['name']} 執行完成",
-                                tool_name=tool_result["name"],
-                                tool_result=tool_result["content"][:500],
-                                reasoning=f"觀察到 {tool_result['name']} 的結果：{tool_result['content'][:200]}{'...' if len(tool_result['content']) > 200 else ''}",
-                                step=steps_taken
-                            ).to_dict())
+                            await on_step({
+                                "status": "observing",
+                                "message": f"工具 {tool_name} 執行完成",
+                                "tool_name": tool_name,
+                                "tool_result": result_excerpt,
+                                "reasoning": f"觀察到 {tool_name} 的結果：{_preview(tool_content, 200)}",
+                                "step": steps_taken
+                            })
                         
                         # === 檢查 Ground Truth 驗證結果 ===
                         # llm_service.handle_tool_call 已經自動驗證了所有工具結果
@@ -590,30 +1053,40 @@ class AgentService:
                                 consecutive_failures += 1
                                 logger.warning(f"工具結果驗證失敗: {validation_result['reason']}")
                                 if on_step:
-                                    await on_step(StreamEvent(
-                                        status="validation_failed",
-                                        message=f"工具結果驗證: {validation_result['reason']}",
-                                tool_name=tool_result["name"],
-                                        step=steps_taken
-                                    ).to_dict())
+                                    await on_step({
+                                        "status": "validation_failed",
+                                        "message": f"工具結果驗證: {validation_result['reason']}",
+                                        "tool_name": tool_name,
+                                        "step": steps_taken
+                                    })
                             else:
                                 consecutive_failures = 0  # 重置連續失敗計數
                         
                         # 記錄工具結果用於循環檢測
-                        tool_result_signature = f"{tool_result['name']}:{hash(tool_result['content'][:100])}"
+                        tool_result_signature = f"{tool_name}:{hash(tool_content[:100])}"
+                        if loop_detection_window > 0 and len(tool_result_history) == loop_detection_window:
+                            tool_signature_counts[tool_result_history[0]] -= 1
                         tool_result_history.append(tool_result_signature)
+                        tool_signature_counts[tool_result_signature] += 1
                     
                     # === 動態反思觸發 ===
                     should_reflect = False
                     reflection_reason = ""
                     
                     # 觸發條件 1: 固定步數反思
+                    # 本步工具結果均有效且有實質內容時，反思多半是重複勞動，跳過這次 LLM 往返
                     if enable_reflection and steps_taken % self.reflection_threshold == 0:
-                        should_reflect = True
-                        reflection_reason = f"已完成 {steps_taken} 步"
+                        results_look_weak = any(
+                            len(tool_result["content"]) < 20
+                            or not tool_result.get("validation", {}).get("is_valid", True)
+                            for tool_result in tool_results
+                        )
+                        if results_look_weak:
+                            should_reflect = True
+                            reflection_reason = f"已完成 {steps_taken} 步"
                     
                     # 觸發條件 2: 工具執行時間過長
-                    if self.enable_dynamic_reflection and tool_duration > getattr(settings, 'AGENT_TOOL_TIMEOUT_THRESHOLD', 10000):
+                    if self.enable_dynamic_reflection and tool_duration > self.tool_timeout_threshold:
                         should_reflect = True
                         reflection_reason = f"工具執行時間過長 ({tool_duration}ms)"
                     
@@ -625,16 +1098,27 @@ class AgentService:
                     # 執行反思
                     if should_reflect:
                         if on_step:
-                            await on_step(StreamEvent(
-                                status="reflecting_trigger",
-                                message=f"觸發反思: {reflection_reason}",
-                                step=steps_taken
-                            ).to_dict())
+                            await on_step({
+                                "status": "reflecting_trigger",
+                                "message": f"觸發反思: {reflection_reason}",
+                                "step": steps_taken
+                            })
                         await self._perform_reflection(
                             messages, model_name, steps_taken,
                             execution_trace, reasoning_steps, on_step
                         )
                     
+                    # 預測下一個工具調用，在等待下一次 LLM 響應期間預取結果
+                    if tool_predictor is not None:
+                        prefetch_signature = tool_predictor.predict(_tool_call_signature(tool_calls[-1]))
+                        if prefetch_signature is not None:
+                            prefetch_attempts += 1
+                            prefetch_task = asyncio.create_task(llm_service.prefetch_tool_call({
+                                "id": "prefetch",
+                                "type": "function",
+                                "function": {"name": prefetch_signature[0], "arguments": prefetch_signature[1]}
+                            }))
+                    
                     # 繼續下一輪決策
                     continue
                 
@@ -642,13 +1126,23 @@ class AgentService:
                     # 沒有工具調用，LLM 認為任務完成或直接回答
                     
                     # === 任務完成自評估 ===
-                    if self.enable_self_evaluation and content:
+                    # 直接回答（未使用工具、內容足夠長且正常結束）視為完成，省去一次評估請求
+                    needs_assessment = bool(tools_used) or len(content or "") < 200 or finish_reason != "stop"
+                    if self.enable_self_evaluation and content and not needs_assessment:
+                        task_completion_confidence = 0.85
+                        trace_append({
+                            "timestamp": _now_iso(),
+                            "state": AgentState.RESPONDING.value,
+                            "action": "任務完成評估（啟發式跳過：直接回答）",
+                            "completion_confidence": task_completion_confidence
+                        })
+                    elif self.enable_self_evaluation and content:
                         if on_step:
-                            await on_step(StreamEvent(
-                                status="assessing",
-                                message="正在評估任務完成度...",
-                                step=steps_taken
-                            ).to_dict())
+                            await on_step({
+                                "status": "assessing",
+                                "message": "正在評估任務完成度...",
+                                "step": steps_taken
+                            })
                         
                         assessment = await assess_task_completion(
                             prompt, content, tools_used, 
@@ -664,12 +1158,12 @@ class AgentService:
                             
                             if recommendation == "continue" and steps_taken < max_steps_limit - 1:
                                 if on_step:
-                                    await on_step(StreamEvent(
-                                        status="incomplete",
-                                        message=f"任務評估: 完成度 {task_completion_confidence:.0%}，缺少: {', '.join(missing[:3])}",
-                                        details={"confidence": task_completion_confidence, "missing": missing},
-                                        step=steps_taken
-                                    ).to_dict())
+                                    await on_step({
+                                        "status": "incomplete",
+                                        "message": f"任務評估: 完成度 {task_completion_confidence:.0%}，缺少: {', '.join(missing[:3])}",
+                                        "details": {"confidence": task_completion_confidence, "missing": missing},
+                                        "step": steps_taken
+                                    })
                                 
                                 # 添加補充提示讓 LLM 繼續完善
                                 messages.append({
@@ -678,8 +1172,8 @@ class AgentService:
                                 })
                                 continue  # 繼續下一輪
                         
-                        execution_trace.append({
-                            "timestamp": datetime.now().isoformat(),
+                        trace_append({
+                            "timestamp": _now_iso(),
                             "state": AgentState.RESPONDING.value,
                             "action": "任務完成評估",
                             "assessment": assessment
@@ -694,62 +1188,111 @@ class AgentService:
                         "content": content
                     })
                     
-                    execution_trace.append({
-                        "timestamp": datetime.now().isoformat(),
+                    trace_append({
+                        "timestamp": _now_iso(),
                         "state": AgentState.RESPONDING.value,
                         "action": "生成最終響應",
                         "completion_confidence": task_completion_confidence
                     })
                     
                     if on_step:
-                        await on_step(StreamEvent(
-                            status="responding",
-                            message="正在生成最終回覆...",
-                            step=steps_taken,
-                            details={"completion_confidence": task_completion_confidence}
-                        ).to_dict())
+                        await on_step({
+                            "status": "responding",
+                            "message": "正在生成最終回覆...",
+                            "step": steps_taken,
+                            "details": {"completion_confidence": task_completion_confidence}
+                        })
                     
                     break
             
+            # 記錄成功完成任務的工具調用序列
+            if plan_key is not None and stop_reason == "task_complete":
+                plan = [
+                    [
+                        {"name": tc.get("function", {}).get("name", ""), "arguments": tc.get("function", {}).get("arguments", "{}")}
+                        for tc in entry["tool_calls"]
+                    ]
+                    for entry in execution_trace
+                    if entry.get("state") == AgentState.EXECUTING.value and entry.get("tool_calls")
+                ]
+                # 含有副作用工具的計劃重放時會重複寫入記憶或生成圖片，不快取
+                if plan and not any(call["name"] in _SIDE_EFFECT_TOOLS for batch in plan for call in batch):
+                    self.plan_cache.set(plan_key, plan)
+            
+            # 以成功完成任務的工具調用順序更新預取轉移表
+            if tool_predictor is not None and stop_reason == "task_complete":
+                tool_predictor.record([
+                    _tool_call_signature(tc)
+                    for entry in execution_trace
+                    if entry.get("state") == AgentState.EXECUTING.value and entry.get("tool_calls")
+                    for tc in entry["tool_calls"]
+                ])
+            
             # 如果達到最大步驟數，生成總結
             if steps_taken >= max_steps_limit and final_response is None:
-                execution_trace.append({
-                    "timestamp": datetime.now().isoformat(),
+                trace_append({
+                    "timestamp": _now_iso(),
                     "state": AgentState.RESPONDING.value,
                     "action": "達到最大步驟數，生成總結響應"
                 })
                 
                 if on_step:
-                    await on_step(StreamEvent(
-                        status="summarizing",
-                        message="達到最大步驟數，正在生成總結...",
-                        step=steps_taken
-                    ).to_dict())
-                
-                # 添加總結提示
-                summary_prompt = {
-                    "role": "user",
-                    "content": settings.PROMPT_SUMMARY_MESSAGE
-                }
-                messages.append(summary_prompt)
+                    await on_step({
+                        "status": "summarizing",
+                        "message": "達到最大步驟數，正在生成總結...",
+                        "step": steps_taken
+                    })
                 
-                await self._update_usage_stats(user_id, model_name)
-                final_response = await self._send_request_with_retry(
-                    messages, model_name, None, on_step
-                )
+                if self.local_summary:
+                    # 直接由推理步驟拼接總結，省去一次 LLM 請求
+                    summary = "已執行步驟：\n" + "\n".join(
+                        f"- {step.get('title', step.get('type', ''))}: {_preview(step.get('content') or '', 200)}"
+                        for step in reasoning_steps
+                    )
+                    final_response = {
+                        "choices": [{
+                            "message": {"role": "assistant", "content": summary},
+                            "finish_reason": "length"
+                        }]
+                    }
+                else:
+                    # 添加總結提示
+                    summary_prompt = {
+                        "role": "user",
+                        "content": settings.PROMPT_SUMMARY_MESSAGE
+                    }
+                    messages.append(summary_prompt)
+                    
+                    # 可配置較便宜的總結模型，未配置時使用當前模型
+                    summary_model = self.summary_model or model_name
+                    if summary_model == model_name:
+                        llm_calls += 1
+                    else:
+                        self._update_usage_stats(user_id, summary_model)
+                    final_response = await self._send_request_with_retry(
+                        _prune_to_budget(messages, context_budget, context_keep_last),
+                        summary_model, None, on_step, step=steps_taken
+                    )
             
             # 提取最終回覆
             final_content = ""
             if final_response and "choices" in final_response and final_response["choices"]:
                 final_message = final_response["choices"][0].get("message", {})
-                final_content = final_message.get("content", "")
-                
                 # 如果 content 為空，嘗試其他字段
-                if not final_content:
-                    final_content = final_message.get("reasoning", "")
+                final_content = final_message.get("content") or final_message.get("reasoning") or ""
             
-            # 計算執行時間
-            execution_time = time.time() - start_time
+            # 快取成功完成且未使用有副作用工具（圖片生成、記憶寫入）的回覆
+            if (
+                response_key is not None
+                and stop_reason == "task_complete"
+                and final_content
+                and not any(tool["name"] in _SIDE_EFFECT_TOOLS for tool in tools_used)
+            ):
+                self.response_cache.set(response_key, final_content)
+            
+            # 計算執行時間，並取生成圖片的快照（完成事件與返回值看到同一份）
+            execution_time = time.perf_counter() - start_time
+            last_image = llm_service.last_generated_image
             
             # === 完整的執行診斷信息 ===
             execution_summary = {
@@ -760,65 +1303,64 @@ class AgentService:
                 "consecutive_failures_final": consecutive_failures,
                 "completion_confidence": task_completion_confidence,
                 "loop_detected": stop_reason == "loop_detected",
-                "timeout": stop_reason == "execution_timeout"
+                "timeout": stop_reason == "execution_timeout",
+                "tool_prefetch": {"attempts": prefetch_attempts, "hits": prefetch_hits}
             }
             
-            # 發送完成事件 - 包含完整的響應數據
-            if on_step:
-                await on_step({
-                    "status": "done",
-                    "message": final_content,
-                    "is_final": True,
-                    "step": steps_taken,
-                    "response": final_response or {"choices": [{"message": {"role": "assistant", "content": final_content}}]},
-                    "execution_trace": execution_trace,
-                    "reasoning_steps": reasoning_steps,
-                    "tools_used": tools_used,
-                    "execution_time": execution_time,
-                    "steps_taken": steps_taken,
-                    "success": True,
-                    "generated_image": llm_service.last_generated_image,
-                    "execution_summary": execution_summary
-                })
-            
-            # 更新用戶記憶（後台）- 根據配置決定是否自動保存
-            auto_save_memory = getattr(settings, 'AGENT_AUTO_SAVE_MEMORY', True)
-            if enable_memory and auto_save_memory:
-                asyncio.create_task(background_memory_update(user_id, prompt))
-                logger.info(f"記憶更新任務已在後台啟動，用戶ID: {user_id}")
-            
-            # 保存聊天記錄
-            await create_chat_log(user_id, model_name, prompt, final_content, interaction_id)
-            
-            return {
+            # 執行結果只構建一次，完成事件與返回值共用
+            result = {
                 "success": True,
                 "interaction_id": interaction_id,
                 "response": final_response or {"choices": [{"message": {"role": "assistant", "content": final_content}}]},
-                "execution_trace": execution_trace,
+                "execution_trace": execution_trace if self.trace_verbose else _compact_trace(execution_trace, self.trace_max_entries),
                 "reasoning_steps": reasoning_steps,
                 "tools_used": tools_used,
                 "execution_time": execution_time,
                 "steps_taken": steps_taken,
-                "generated_image": llm_service.last_generated_image,
+                "generated_image": last_image,
                 "execution_summary": execution_summary
             }
             
+            # 先排程響應後的副作用（記憶更新、聊天記錄），再推送完成事件，使兩者與推送重疊
+            # 更新用戶記憶（後台）- 根據配置決定是否自動保存
+            # （回覆快取命中時提示與上次相同，無需再次更新記憶）
+            if enable_memory and self.auto_save_memory and stop_reason != "response_cache":
+                self._spawn_background(self._guarded_memory_update(user_id, prompt))
+                logger.info(f"記憶更新任務已在後台啟動，用戶ID: {user_id}")
+            
+            # 保存聊天記錄（後台寫入，不阻塞響應返回；create_chat_log 內部已捕獲並記錄錯誤）
+            self._spawn_background(create_chat_log(user_id, model_name, prompt, final_content, interaction_id))
+            
+            # 發送完成事件 - 包含完整的響應數據
+            # （中間步驟事件不攜帶 execution_trace / reasoning_steps，完整列表只在此序列化一次）
+            if on_step:
+                await on_step({
+                    **result,
+                    "status": "done",
+                    "message": final_content,
+                    "is_final": True,
+                    "step": steps_taken
+                })
+            
+            return result
+            
         except Exception as e:
-            execution_time = time.time() - start_time
-            logger.error(f"Agent執行錯誤: {str(e)}", exc_info=True)
+            execution_time = time.perf_counter() - start_time
+            # 僅在 DEBUG 級別記錄完整堆疊，避免錯誤集中爆發時大量格式化 traceback
+            logger.error("Agent執行錯誤: %s", e, exc_info=logger.isEnabledFor(logging.DEBUG))
             
-            execution_trace.append({
-                "timestamp": datetime.now().isoformat(),
+            trace_append({
+                "timestamp": _now_iso(),
                 "state": AgentState.ERROR.value,
                 "action": f"執行錯誤: {str(e)}"
             })
             
             if on_step:
-                await on_step(StreamEvent(
-                    status="error",
-                    message=str(e),
-                    details={"error": True}
-                ).to_dict())
+                await on_step({
+                    "status": "error",
+                    "message": str(e),
+                    "details": {"error": True}
+                })
             
             return {
                 "success": False,
@@ -831,13 +1373,103 @@ class AgentService:
                         }
                     }]
                 },
-                "execution_trace": execution_trace,
+                "execution_trace": execution_trace if self.trace_verbose else _compact_trace(execution_trace, self.trace_max_entries),
                 "reasoning_steps": reasoning_steps,
                 "tools_used": tools_used,
                 "execution_time": execution_time,
                 "steps_taken": steps_taken,
                 "generated_image": None
             }
+        
+        finally:
+            # 停止條件提前結束或出錯時，丟棄未使用的預取
+            if prefetch_task is not None:
+                prefetch_task.cancel()
+            # 整次執行的使用量合併為一次寫入（成功與失敗路徑都會執行）
+            if llm_calls:
+                self._update_usage_stats(user_id, model_name, llm_calls)
+    
+    @staticmethod
+    def _plan_cache_key(user_id: str, model_name: str, prompt: str, tools: List[Dict[str, Any]]) -> tuple:
+        """執行計劃/回覆快取鍵：用戶、模型、規範化提示（合併空白、小寫）與可用工具集合"""
+        normalized_prompt = " ".join(prompt.split()).lower()
+        tool_names = tuple(sorted(tool.get("function", {}).get("name", "") for tool in tools))
+        return (user_id, model_name, normalized_prompt, tool_names)
+    
+    async def _replay_plan(
+        self,
+        plan: List[List[Dict[str, Any]]],
+        messages: List[Dict[str, Any]],
+        model_name: str,
+        user_id: str,
+        on_step: Optional[Callable] = None
+    ) -> Optional[tuple]:
+        """
+        重放快取的工具調用序列
+        
+        按原順序重新執行工具（不經過 LLM 規劃），最後只發送一次不帶工具的
+        LLM 請求生成回覆。任一工具失敗或驗證不通過時返回 None，
+        原 messages 不受影響，調用方回退到正常循環。
+        
+        Returns:
+            (最終響應, 工具使用記錄) 或 None
+        """
+        replay_messages = list(messages)
+        replayed_tools = []
+        
+        for step_index, step_calls in enumerate(plan, 1):
+            tool_calls = [
+                {
+                    "id": f"call_{uuid.uuid4().hex[:24]}",
+                    "type": "function",
+                    "function": {"name": call["name"], "arguments": call["arguments"]}
+                }
+                for call in step_calls
+            ]
+            if on_step:
+                await on_step({
+                    "status": "executing",
+                    "message": f"重放執行計劃: {', '.join(call['name'] for call in step_calls)}",
+                    "step": step_index
+                })
+            
+            tool_start_time = time.perf_counter()
+            tool_results = await llm_service.handle_tool_call(tool_calls)
+            tool_duration = int((time.perf_counter() - tool_start_time) * 1000)
+            if len(tool_results) != len(tool_calls) or any(
+                not result.get("validation", {}).get("is_valid", True) for result in tool_results
+            ):
+                logger.info("執行計劃重放失敗，回退到正常執行循環")
+                return None
+            
+            replay_messages.append({"role": "assistant", "content": "", "tool_calls": tool_calls})
+            replay_messages.extend(
+                {
+                    "role": "tool",
+                    "tool_call_id": result["tool_call_id"],
+                    "name": result["name"],
+                    "content": result["content"]
+                }
+                for result in tool_results
+            )
+            replayed_tools.extend(
+                {
+                    "name": result["name"],
+                    "result": result["content"][:500],
+                    "duration": tool_duration,
+                    "cached": result.get("cached", False),
+                    "timestamp": _now_iso()
+                }
+                for result in tool_results
+            )
+        
+        self._update_usage_stats(user_id, model_name)
+        response = await self._send_request_with_retry(
+            replay_messages, model_name, None, on_step, step=len(plan) + 1
+        )
+        if "error" in response or not response.get("choices"):
+            return None
+        return response, replayed_tools
     
     async def _perform_reflection(
         self,
@@ -851,17 +1483,23 @@ class AgentService:
         """
         執行反思階段
         
-        讓 LLM 回顧當前進度，評估是否需要調整策略
+        讓 LLM 回顧當前進度，評估是否需要調整策略。
+        反思提示在請求前直接追加到 messages（不複製消息歷史），
+        得到反思結果後再追加模型回覆；請求失敗、無結果或被取消時移除該提示。
         """
+        trace_append = execution_trace.append
+        reasoning_append = reasoning_steps.append
+        
+        # 發送反思事件
         if on_step:
-            await on_step(StreamEvent(
-                status="reflecting",
-                message="正在進行反思...",
-                step=steps_taken
-            ).to_dict())
-        
-        execution_trace.append({
-            "timestamp": datetime.now().isoformat(),
+            await on_step({
+                "status": "reflecting",
+                "message": "正在進行反思...",
+                "step": steps_taken
+            })
+        
+        trace_append({
+            "timestamp": _now_iso(),
             "state": AgentState.REFLECTING.value,
             "action": f"開始反思 (步驟 {steps_taken})"
         })
@@ -869,93 +1507,63 @@ class AgentService:
         # 添加反思提示
         reflection_prompt = {
             "role": "user",
-            "content": settings.PROMPT_REFLECTION_MESSAGE
+            "content": self.reflection_message
         }
-        messages.append(reflection_prompt)
         
+        # 反思提示直接追加到消息歷史（不複製整個列表），未得到反思結果時再移除
+        messages.append(reflection_prompt)
+        reflected = False
         try:
-            reflection_response = await llm_service.send_llm_request(messages, model_name)
+            # send_llm_request 對所有 Provider 均以流式請求上游並在內部收集，無需另行切換
+            # 與主循環相同按上下文預算裁剪，長對話中反思只回顧系統提示與最近的輪次
+            reflection_messages = _prune_to_budget(
+                messages, self.context_budget, self.context_keep_last
+            )
+            async with self._llm_semaphore:
+                reflection_response = await llm_service.send_llm_request(reflection_messages, model_name)
             
             if "choices" in reflection_response and reflection_response["choices"]:
                 reflection = reflection_response["choices"][0]["message"].get("content", "")
+                ts = _now_iso()
                 
-                execution_trace.append({
-                    "timestamp": datetime.now().isoformat(),
+                trace_append({
+                    "timestamp": ts,
                     "state": AgentState.REFLECTING.value,
                     "action": "反思完成",
                     "reflection": reflection
                 })
                 
-                reasoning_steps.append({
+                reasoning_append({
                     "type": "reflection",
                     "title": f"反思 (步驟 {steps_taken})",
                     "content": reflection,
-                    "timestamp": datetime.now().isoformat()
+                    "timestamp": ts
                 })
                 
-                # 將反思結果添加到消息歷史
+                # 將反思結果添加到消息歷史（反思提示已在請求前追加）
                 messages.append({
                     "role": "assistant",
                     "content": reflection
                 })
+                reflected = True
                 
                 if on_step:
-                    await on_step(StreamEvent(
-                        status="reflecting",
-                        message=reflection,
-                        reasoning=reflection,
-                        step=steps_taken
-                    ).to_dict())
+                    await on_step({
+                        "status": "reflecting",
+                        "message": reflection,
+                        "reasoning": reflection,
+                        "step": steps_taken
+                    })
                     
         except Exception as e:
-            logger.error(f"反思階段錯誤: {str(e)}")
+            logger.error("反思階段錯誤: %s", e)
             # 反思失敗不中斷主流程
+        finally:
+            if not reflected and messages and messages[-1] is reflection_prompt:
+                messages.pop()
     
-    async def run_stream(
-        self,
-        user_id: str,
-        prompt: str,
-        model_name: str,
-        enable_memory: bool = True,
-        enable_reflection: bool = True,
-        enable_mcp: bool = True,
-        enable_react_mode: bool = True,  # 保留參數以兼容舊API
-        max_steps: Optional[int] = None,
-        system_prompt_override: Optional[Dict[str, str]] = None,
-        additional_context: Optional[List[Dict[str, str]]] = None,
-        tools_config: Optional[Dict[str, bool]] = None,
-        image: Optional[str] = None,
-        audio: Optional[str] = None,
-        on_step: Optional[Callable] = None
-    ) -> Dict[str, Any]:
-        """
-        流式執行 Agent - 與 run() 相同，但支持流式回調
-        
-        這是統一的執行入口，run() 方法現在也支持 on_step 回調
-        
-        Args:
-            on_step: 異步回調函數，每個推理步驟都會調用
-            其他參數同 run()
-            
-        Returns:
-            執行結果
-        """
-        return await self.run(
-            user_id=user_id,
-            prompt=prompt,
-            model_name=model_name,
-            enable_memory=enable_memory,
-            enable_reflection=enable_reflection,
-            enable_mcp=enable_mcp,
-            enable_react_mode=enable_react_mode,
-            max_steps=max_steps,
-            system_prompt_override=system_prompt_override,
-            additional_context=additional_context,
-            tools_config=tools_config,
-            image=image,
-            audio=audio,
-            on_step=on_step
-        )
+    # 流式執行入口：與 run() 完全相同（run() 已支持 on_step 回調），直接別名避免多一層轉發
+    run_stream = run
 
 
 # 創建 AgentService 的單例實例
@@ -1,4 +1,4 @@
-from typing import List, Dict, Any, Optional, Union
+from typing import List, Dict, Any, Optional, Union, Callable, Awaitable
 import httpx
 import base64
 from datetime import datetime
@@ -6,12 +6,15 @@ import json
 import os
 import logging
 import asyncio
+import hashlib
+import orjson
 
 from app.utils.logger import logger
 from app.core.config import get_settings
 from app.utils.tools import generate_image, search_duckduckgo
 from app.models.mongodb import update_usage, get_user_usage
 from app.models.sqlite import update_usage_sqlite
+from app.utils.cache import TTLCache
 
 # 導入 Provider 模組
 from app.services.providers import (
@@ -26,6 +29,36 @@ from app.services.providers import (
 
 settings = get_settings()
 
+# 工具結果快取配置：只快取不經過 LLM 的確定性工具及其快取時間（秒）
+# 由 LLM 生成結果的工具（翻譯、摘要、代碼生成等）每次結果不同，有副作用的工具與 MCP 工具同樣不快取
+_TOOL_CACHE_TTL = {"searchDuckDuckGo": 600, "fetchWebpageContent": 600}
+# 有副作用的工具：同一批調用中按原順序依次執行（記憶寫入是讀-改-寫，圖片生成會覆蓋 last_generated_image）
+_SEQUENTIAL_TOOLS = {"generateImage", "saveToMemory"}
+
+
+def _is_cacheable_tool_result(content: Any) -> bool:
+    """
+    判断工具结果是否可以快取：失败或空结果不快取，
+    避免一次临时失败（如搜索被限流返回空列表）在TTL内被反复复用
+    """
+    if not content:
+        return False
+    try:
+        parsed = orjson.loads(content)
+    except (orjson.JSONDecodeError, TypeError):
+        return True
+    if not parsed:
+        return False
+    if isinstance(parsed, dict):
+        if "error" in parsed or parsed.get("success") is False:
+            return False
+        # 搜索结果列表与网页正文为空时视为无效结果
+        if "results" in parsed and not parsed["results"]:
+            return False
+        if "content" in parsed and not parsed["content"]:
+            return False
+    return True
+
 
 class LLMService:
     """
@@ -47,6 +80,9 @@ class LLMService:
         # 存儲最近生成的圖片
         self.last_generated_image = None
         
+        # 工具結果快取：鍵為 (工具名稱, 參數SHA-256)
+        self.tool_cache = TTLCache(max_entries=512, ttl=600) if getattr(settings, 'AGENT_ENABLE_TOOL_CACHE', False) else None
+        
         # 使用量文件路徑
         self.usage_path = "./data/usage.json"
         
@@ -760,7 +796,8 @@ class LLMService:
     async def collect_stream_response(
         self,
         stream_generator,
-        model_name: str = ""
+        model_name: str = "",
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None
     ) -> Dict[str, Any]:
         """
         收集流式響應並組合為完整的響應對象
@@ -768,6 +805,7 @@ class LLMService:
         Args:
             stream_generator: 流式響應生成器
             model_name: 模型名稱（用於構建響應）
+            on_delta: 可選的異步回調，每收到一段文本內容即調用（用於逐 token 推送）
             
         Returns:
             完整的響應對象（OpenAI 格式）
@@ -785,10 +823,16 @@ class LLMService:
                 if "error" in chunk:
                     error_info = chunk.get("error", {})
                     if isinstance(error_info, dict):
-                        return {
+                        error_response = {
                             "error": error_info.get("message", "未知錯誤"),
                             "detail": error_info.get("detail", str(error_info))
                         }
+                        # 保留上游狀態碼與 Retry-After，供調用方識別速率限制
+                        if "status_code" in error_info:
+                            error_response["status_code"] = error_info["status_code"]
+                        if "retry_after" in error_info:
+                            error_response["retry_after"] = error_info["retry_after"]
+                        return error_response
                     return {"error": str(error_info), "detail": ""}
                 
                 # 提取響應 ID
@@ -803,6 +847,8 @@ class LLMService:
                     # 累積內容
                     if "content" in delta and delta["content"]:
                         full_content += delta["content"]
+                        if on_delta is not None:
+                            await on_delta(delta["content"])
                     
                     # 處理工具調用
                     if "tool_calls" in delta:
@@ -890,6 +936,7 @@ class LLMService:
         tools: Optional[List[Dict[str, Any]]] = None,
         skip_content_check: bool = False,
         stream: bool = False,
+        on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
         **kwargs
     ):
         """
@@ -905,6 +952,7 @@ class LLMService:
             tools: 可選的工具定義列表
             skip_content_check: 是否跳過內容長度檢查
             stream: 是否返回流式響應（默認 False，返回完整響應）
+            on_delta: stream=False 時，收集過程中每段文本內容的異步回調
             **kwargs: 額外參數傳遞給 Provider
             
         Returns:
@@ -992,26 +1040,152 @@ class LLMService:
             return stream_generator
         else:
             # 收集流式響應為完整響應
-            return await self.collect_stream_response(stream_generator, model_name)
+            return await self.collect_stream_response(stream_generator, model_name, on_delta=on_delta)
         
     # MARK: 处理工具调用
     async def handle_tool_call(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         处理工具调用 - 执行模型请求的工具函数并返回结果
         
+        多个工具调用之间互不依赖，通过 asyncio.gather 并发执行；
+        有副作用的工具（_SEQUENTIAL_TOOLS）之间按原顺序依次执行，
+        返回结果保持与 tool_calls 相同的顺序
+        
         Args:
             tool_calls: 工具调用列表
             
         Returns:
             工具响应列表
         """
-        tool_results = []
+        from app.utils.tools import validate_tool_result  # Anthropic 最佳實踐：Ground Truth 驗證
         
         # 检查工具调用是否为None
         if tool_calls is None:
             logger.warning("工具调用为None，返回空结果列表")
-            return tool_results
-          # 导入工具函数
+            return []
+        
+        # 并发执行所有工具调用，参数格式错误的调用返回None并被忽略
+        sequential_indices = [
+            i for i, tc in enumerate(tool_calls)
+            if tc.get("function", {}).get("name") in _SEQUENTIAL_TOOLS
+        ]
+        if len(sequential_indices) <= 1:
+            results = await asyncio.gather(*(self._handle_tool_call_cached(tc) for tc in tool_calls))
+        else:
+            # 有副作用的工具串行执行，整体作为一个任务与其余工具并发
+            async def run_sequential():
+                return [await self._handle_tool_call_cached(tool_calls[i]) for i in sequential_indices]
+            
+            sequential_set = set(sequential_indices)
+            concurrent_indices = [i for i in range(len(tool_calls)) if i not in sequential_set]
+            sequential_results, *concurrent_results = await asyncio.gather(
+                run_sequential(),
+                *(self._handle_tool_call_cached(tool_calls[i]) for i in concurrent_indices)
+            )
+            results = [None] * len(tool_calls)
+            for i, result in zip(sequential_indices, sequential_results):
+                results[i] = result
+            for i, result in zip(concurrent_indices, concurrent_results):
+                results[i] = result
+        tool_results = [result for result in results if result is not None]
+        
+        # === Anthropic 最佳實踐：Ground Truth 驗證 ===
+        # 統一驗證所有工具結果
+        for tool_result in tool_results:
+            validation = validate_tool_result(tool_result)
+            # 將驗證結果添加到工具結果中
+            tool_result["validation"] = validation
+            
+            # 如果驗證失敗，記錄警告
+            if not validation["is_valid"]:
+                logger.warning(
+                    f"工具 {tool_result.get('name')} 驗證失敗: "
+                    f"{validation['reason']} (嚴重程度: {validation['severity']})"
+                )
+                
+        return tool_results
+
+    def _tool_cache_key(self, tool_call: Dict[str, Any]) -> Optional[tuple]:
+        """计算工具调用的快取键，不可快取的工具或参数无法解析时返回None"""
+        function_call = tool_call.get("function", {})
+        name = function_call.get("name", "")
+        if name not in _TOOL_CACHE_TTL:
+            return None
+        
+        arguments = function_call.get("arguments", "{}")
+        try:
+            if isinstance(arguments, str):
+                arguments = json.loads(arguments) if arguments.strip() else {}
+            digest = hashlib.sha256(orjson.dumps(arguments, option=orjson.OPT_SORT_KEYS)).hexdigest()
+        except (ValueError, TypeError):
+            return None
+        return (name, digest)
+
+    async def prefetch_tool_call(self, tool_call: Dict[str, Any]) -> bool:
+        """
+        预取工具结果到快取，供随后相同的工具调用直接命中
+
+        只有可快取（无副作用）的工具会被执行；不可快取或已有快取时不执行任何操作
+
+        Returns:
+            是否实际执行了工具
+        """
+        cache_key = self._tool_cache_key(tool_call) if self.tool_cache is not None else None
+        if cache_key is None or self.tool_cache.get(cache_key) is not None:
+            return False
+        try:
+            await self._handle_tool_call_cached(tool_call)
+        except Exception as e:
+            logger.warning(f"工具预取失败: {cache_key[0]}: {e}")
+        return True
+
+    async def _handle_tool_call_cached(self, tool_call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """执行单个工具调用，相同工具与参数的重复调用直接返回快取结果"""
+        cache_key = self._tool_cache_key(tool_call) if self.tool_cache is not None else None
+        if cache_key is not None:
+            cached_content = self.tool_cache.get(cache_key)
+            if cached_content is not None:
+                logger.info(f"工具结果快取命中: {cache_key[0]}")
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": cache_key[0],
+                    "content": cached_content,
+                    "cached": True
+                }
+        
+        # 单个工具超时不拖住同批并发执行的其他工具
+        timeout = getattr(settings, 'AGENT_TOOL_EXECUTION_TIMEOUT', 120.0)
+        try:
+            result = await asyncio.wait_for(self.handle_single_tool_call(tool_call), timeout)
+        except asyncio.TimeoutError:
+            name = tool_call.get("function", {}).get("name", "")
+            logger.error(f"工具执行超时 ({timeout}秒): {name}")
+            return {
+                "tool_call_id": tool_call.get("id", ""),
+                "role": "tool",
+                "name": name,
+                "content": json.dumps({"error": f"tool execution timed out after {timeout} seconds"})
+            }
+        
+        # 只快取成功且非空的结果
+        if cache_key is not None and result is not None:
+            content = result.get("content", "")
+            if _is_cacheable_tool_result(content):
+                self.tool_cache.set(cache_key, content, ttl=_TOOL_CACHE_TTL[cache_key[0]])
+        return result
+
+    async def handle_single_tool_call(self, tool_call: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        执行单个工具调用
+        
+        Args:
+            tool_call: 工具调用
+            
+        Returns:
+            工具响应；参数格式无法识别时返回None
+        """
+        # 导入工具函数
         from app.utils.tools import (
             generate_image, 
             search_duckduckgo,
@@ -1027,430 +1201,398 @@ class LLMService:
             retrieve_from_memory,
             create_date_plan,
             integrate_information,
-            generate_code,
-            validate_tool_result  # Anthropic 最佳實踐：Ground Truth 驗證
+            generate_code
         )
         # 注意：不再导入MCP工具，MCP工具应该由MCP客户端动态处理
         
-        # 逐个处理工具调用
-        for tool_call in tool_calls:
-            function_call = tool_call.get("function", {})
-            name = function_call.get("name", "")
-            arguments_str = function_call.get("arguments", "{}")
-            try:
-                # 解析参数 - 如果已经是dict就直接使用，如果是字符串就解析
-                if isinstance(arguments_str, dict):
-                    arguments = arguments_str
-                elif isinstance(arguments_str, str):
-                    # 處理空字符串的情況
-                    if not arguments_str or not arguments_str.strip():
-                        arguments = {}
-                    else:
-                        arguments = json.loads(arguments_str)
+        function_call = tool_call.get("function", {})
+        name = function_call.get("name", "")
+        arguments_str = function_call.get("arguments", "{}")
+        try:
+            # 解析参数 - 如果已经是dict就直接使用，如果是字符串就解析
+            if isinstance(arguments_str, dict):
+                arguments = arguments_str
+            elif isinstance(arguments_str, str):
+                # 處理空字符串的情況
+                if not arguments_str or not arguments_str.strip():
+                    arguments = {}
                 else:
-                    logger.error(f"工具调用参数格式错误: {type(arguments_str)}")
-                    continue
-                
-                # 图像生成工具
-                if name == "generateImage":
-                    logger.info(f"处理图片生成工具调用，参数: {arguments}")
-                    prompt = arguments.get("prompt", "")
-                    if not prompt:
-                        logger.error("图片生成缺少prompt参数")
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "generateImage",
-                            "content": json.dumps({"error": "missing prompt parameter"})
-                        })
-                        continue
-                        
-                    image_data_uri = await generate_image(prompt)
-                    if image_data_uri:
-                        # 图像生成成功
-                        logger.info(f"图片生成成功，dataURI长度: {len(image_data_uri)}")
-                        
-                        # 存储图片数据以供API响应使用，但不直接发送给LLM
-                        # 将图片数据存储在一个全局变量或上下文中
-                        self.last_generated_image = image_data_uri
-                        
-                        # 只向LLM返回成功消息，不包含实际图片数据
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "generateImage",
-                            "content": json.dumps({"success": True, "message": "图片已成功生成，将在回复中显示"})
-                        })
-                    else:
-                        # 图像生成失败
-                        logger.error("图片生成失败，返回错误信息")
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "generateImage",
-                            "content": json.dumps({"error": "图片生成失败，请稍后重试"})
-                        })
-                  # 搜索工具
-                elif name == "searchDuckDuckGo":
-                    search_results = await search_duckduckgo(
-                        arguments.get("query", ""),
-                        arguments.get("numResults", 5)
-                    )
+                    arguments = json.loads(arguments_str)
+            else:
+                logger.error(f"工具调用参数格式错误: {type(arguments_str)}")
+                return None
+            
+            # 图像生成工具
+            if name == "generateImage":
+                logger.info(f"处理图片生成工具调用，参数: {arguments}")
+                prompt = arguments.get("prompt", "")
+                if not prompt:
+                    logger.error("图片生成缺少prompt参数")
+                    return {
+                        "tool_call_id": tool_call.get("id", ""),
+                        "role": "tool",
+                        "name": "generateImage",
+                        "content": json.dumps({"error": "missing prompt parameter"})
+                    }
                     
-                    tool_results.append({
+                image_data_uri = await generate_image(prompt)
+                if image_data_uri:
+                    # 图像生成成功
+                    logger.info(f"图片生成成功，dataURI长度: {len(image_data_uri)}")
+                    
+                    # 存储图片数据以供API响应使用，但不直接发送给LLM
+                    # 将图片数据存储在一个全局变量或上下文中
+                    self.last_generated_image = image_data_uri
+                    
+                    # 只向LLM返回成功消息，不包含实际图片数据
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
-                        "name": "searchDuckDuckGo",
-                        "content": json.dumps({"results": search_results})
-                    })
-                
-                # 网页内容获取工具
-                elif name == "fetchWebpageContent":
-                    url = arguments.get("url", "")
-                    if not url:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "fetchWebpageContent",
-                            "content": json.dumps({"error": "missing url parameter"})
-                        })
-                        continue
-                        
-                    webpage_content = await fetch_webpage_content(url)
-                    if webpage_content:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "fetchWebpageContent",
-                            "content": json.dumps({"success": True, "content": webpage_content})
-                        })
-                    else:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "fetchWebpageContent",
-                            "content": json.dumps({"error": "Failed to fetch webpage content"})
-                        })
-                
-                # 文本分析工具
-                elif name == "analyzeText":
-                    text = arguments.get("text", "")
-                    task = arguments.get("task", "")
-                    if not text or not task:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "analyzeText",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    analysis_result = await analyze_text(text, task)
-                    tool_results.append({
+                        "name": "generateImage",
+                        "content": json.dumps({"success": True, "message": "图片已成功生成，将在回复中显示"})
+                    }
+                else:
+                    # 图像生成失败
+                    logger.error("图片生成失败，返回错误信息")
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
-                        "name": "analyzeText",
-                        "content": json.dumps(analysis_result)
-                    })
+                        "name": "generateImage",
+                        "content": json.dumps({"error": "图片生成失败，请稍后重试"})
+                    }
+              # 搜索工具
+            elif name == "searchDuckDuckGo":
+                search_results = await search_duckduckgo(
+                    arguments.get("query", ""),
+                    arguments.get("numResults", 5)
+                )
                 
-                # 内容格式转换工具
-                elif name == "formatContent":
-                    content = arguments.get("content", "")
-                    output_format = arguments.get("outputFormat", "")
-                    if not content or not output_format:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "formatContent",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    format_result = await format_content(content, output_format)
-                    tool_results.append({
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "searchDuckDuckGo",
+                    "content": json.dumps({"results": search_results})
+                }
+            
+            # 网页内容获取工具
+            elif name == "fetchWebpageContent":
+                url = arguments.get("url", "")
+                if not url:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
-                        "name": "formatContent",
-                        "content": json.dumps(format_result)
-                    })
-                
-                # Agent性能评估工具
-                elif name == "evaluateAgentPerformance":
-                    execution_trace = arguments.get("executionTrace", [])
-                    expected_outcome = arguments.get("expectedOutcome", None)
+                        "name": "fetchWebpageContent",
+                        "content": json.dumps({"error": "missing url parameter"})
+                    }
                     
-                    evaluation_result = await evaluate_agent_performance(execution_trace, expected_outcome)
-                    tool_results.append({
+                webpage_content = await fetch_webpage_content(url)
+                if webpage_content:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
-                        "name": "evaluateAgentPerformance",
-                        "content": json.dumps(evaluation_result)
-                    })
-                
-                # 新增工具处理: 结构化数据生成
-                elif name == "generateStructuredData":
-                    data_type = arguments.get("data_type", "")
-                    requirements = arguments.get("requirements", "")
-                    schema = arguments.get("schema", None)
+                        "name": "fetchWebpageContent",
+                        "content": json.dumps({"success": True, "content": webpage_content})
+                    }
+                else:
+                    return {
+                        "tool_call_id": tool_call.get("id", ""),
+                        "role": "tool",
+                        "name": "fetchWebpageContent",
+                        "content": json.dumps({"error": "Failed to fetch webpage content"})
+                    }
+            
+            # 文本分析工具
+            elif name == "analyzeText":
+                text = arguments.get("text", "")
+                task = arguments.get("task", "")
+                if not text or not task:
+                    return {
+                        "tool_call_id": tool_call.get("id", ""),
+                        "role": "tool",
+                        "name": "analyzeText",
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not data_type or not requirements:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "generateStructuredData",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await generate_structured_data(data_type, requirements, schema)
-                    tool_results.append({
+                analysis_result = await analyze_text(text, task)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "analyzeText",
+                    "content": json.dumps(analysis_result)
+                }
+            
+            # 内容格式转换工具
+            elif name == "formatContent":
+                content = arguments.get("content", "")
+                output_format = arguments.get("outputFormat", "")
+                if not content or not output_format:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
-                        "name": "generateStructuredData",
-                        "content": json.dumps(result)
-                    })
+                        "name": "formatContent",
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
+                    
+                format_result = await format_content(content, output_format)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "formatContent",
+                    "content": json.dumps(format_result)
+                }
+            
+            # Agent性能评估工具
+            elif name == "evaluateAgentPerformance":
+                execution_trace = arguments.get("executionTrace", [])
+                expected_outcome = arguments.get("expectedOutcome", None)
                 
-                # 新增工具处理: 文本摘要
-                elif name == "summarizeContent":
-                    text = arguments.get("text", "")
-                    max_length = arguments.get("max_length", 500)
+                evaluation_result = await evaluate_agent_performance(execution_trace, expected_outcome)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "evaluateAgentPerformance",
+                    "content": json.dumps(evaluation_result)
+                }
+            
+            # 新增工具处理: 结构化数据生成
+            elif name == "generateStructuredData":
+                data_type = arguments.get("data_type", "")
+                requirements = arguments.get("requirements", "")
+                schema = arguments.get("schema", None)
+                
+                if not data_type or not requirements:
+                    return {
+                        "tool_call_id": tool_call.get("id", ""),
+                        "role": "tool",
+                        "name": "generateStructuredData",
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not text:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "summarizeContent",
-                            "content": json.dumps({"error": "missing text parameter"})
-                        })
-                        continue
-                        
-                    result = await summarize_content(text, max_length)
-                    tool_results.append({
+                result = await generate_structured_data(data_type, requirements, schema)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "generateStructuredData",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 文本摘要
+            elif name == "summarizeContent":
+                text = arguments.get("text", "")
+                max_length = arguments.get("max_length", 500)
+                
+                if not text:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "summarizeContent",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 文本翻译
-                elif name == "translateText":
-                    text = arguments.get("text", "")
-                    target_language = arguments.get("target_language", "")
+                        "content": json.dumps({"error": "missing text parameter"})
+                    }
                     
-                    if not text or not target_language:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "translateText",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await translate_text(text, target_language)
-                    tool_results.append({
+                result = await summarize_content(text, max_length)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "summarizeContent",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 文本翻译
+            elif name == "translateText":
+                text = arguments.get("text", "")
+                target_language = arguments.get("target_language", "")
+                
+                if not text or not target_language:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "translateText",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 数据问答
-                elif name == "answerFromData":
-                    question = arguments.get("question", "")
-                    data = arguments.get("data", [])
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not question or not data:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "answerFromData",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await answer_from_data(question, data)
-                    tool_results.append({
+                result = await translate_text(text, target_language)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "translateText",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 数据问答
+            elif name == "answerFromData":
+                question = arguments.get("question", "")
+                data = arguments.get("data", [])
+                
+                if not question or not data:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "answerFromData",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 保存到记忆
-                elif name == "saveToMemory":
-                    user_id = arguments.get("user_id", "")
-                    key = arguments.get("key", "")
-                    value = arguments.get("value", {})
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not user_id or not key:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "saveToMemory",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await save_to_memory(user_id, key, value)
-                    tool_results.append({
+                result = await answer_from_data(question, data)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "answerFromData",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 保存到记忆
+            elif name == "saveToMemory":
+                user_id = arguments.get("user_id", "")
+                key = arguments.get("key", "")
+                value = arguments.get("value", {})
+                
+                if not user_id or not key:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "saveToMemory",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 从记忆检索
-                elif name == "retrieveFromMemory":
-                    user_id = arguments.get("user_id", "")
-                    key = arguments.get("key", None)
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not user_id:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "retrieveFromMemory",
-                            "content": json.dumps({"error": "missing user_id parameter"})
-                        })
-                        continue
-                        
-                    result = await retrieve_from_memory(user_id, key)
-                    tool_results.append({
+                result = await save_to_memory(user_id, key, value)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "saveToMemory",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 从记忆检索
+            elif name == "retrieveFromMemory":
+                user_id = arguments.get("user_id", "")
+                key = arguments.get("key", None)
+                
+                if not user_id:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "retrieveFromMemory",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 创建日程计划
-                elif name == "createDatePlan":
-                    location = arguments.get("location", "")
-                    interests = arguments.get("interests", [])
-                    budget = arguments.get("budget", None)
-                    duration = arguments.get("duration", None)
+                        "content": json.dumps({"error": "missing user_id parameter"})
+                    }
                     
-                    if not location or not interests:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "createDatePlan",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await create_date_plan(location, interests, budget, duration)
-                    tool_results.append({
+                result = await retrieve_from_memory(user_id, key)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "retrieveFromMemory",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 创建日程计划
+            elif name == "createDatePlan":
+                location = arguments.get("location", "")
+                interests = arguments.get("interests", [])
+                budget = arguments.get("budget", None)
+                duration = arguments.get("duration", None)
+                
+                if not location or not interests:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "createDatePlan",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 信息整合
-                elif name == "integrateInformation":
-                    sources = arguments.get("sources", [])
-                    question = arguments.get("question", "")
-                    format = arguments.get("format", "markdown")
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not sources or not question:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "integrateInformation",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await integrate_information(sources, question, format)
-                    tool_results.append({
+                result = await create_date_plan(location, interests, budget, duration)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "createDatePlan",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 信息整合
+            elif name == "integrateInformation":
+                sources = arguments.get("sources", [])
+                question = arguments.get("question", "")
+                format = arguments.get("format", "markdown")
+                
+                if not sources or not question:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "integrateInformation",
-                        "content": json.dumps(result)
-                    })
-                
-                # 新增工具处理: 代码生成
-                elif name == "generateCode":
-                    requirement = arguments.get("requirement", "")
-                    language = arguments.get("language", "")
-                    framework = arguments.get("framework", None)
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
                     
-                    if not requirement or not language:
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": "generateCode",
-                            "content": json.dumps({"error": "missing required parameters"})
-                        })
-                        continue
-                        
-                    result = await generate_code(requirement, language, framework)
-                    tool_results.append({
+                result = await integrate_information(sources, question, format)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "integrateInformation",
+                    "content": json.dumps(result)
+                }
+            
+            # 新增工具处理: 代码生成
+            elif name == "generateCode":
+                requirement = arguments.get("requirement", "")
+                language = arguments.get("language", "")
+                framework = arguments.get("framework", None)
+                
+                if not requirement or not language:
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": "generateCode",
-                        "content": json.dumps(result)
-                    })
-                  # MCP工具调用处理
-                elif name.startswith("mcp_"):
-                    # 这是MCP工具调用，通过MCP客户端处理
-                    try:
-                        # 将mcp_server_tool格式转换回server:tool
-                        tool_key = name[4:].replace('_', ':', 1)  # 移除mcp_前缀，第一个_替换为:
-                        
-                        from app.services.mcp_client import mcp_client
-                        
-                        # 通过MCP客户端调用工具
-                        mcp_result = await mcp_client.call_tool(tool_key, arguments)
-                        
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": name,
-                            "content": json.dumps(mcp_result)
-                        })
-                        
-                    except Exception as e:
-                        logger.error(f"MCP工具调用失败 {name}: {str(e)}")
-                        tool_results.append({
-                            "tool_call_id": tool_call.get("id", ""),
-                            "role": "tool",
-                            "name": name,
-                            "content": json.dumps({"success": False, "error": f"MCP工具调用失败: {str(e)}"})
-                        })
-                
-                  # 不支持的工具
-                else:
-                    tool_results.append({
+                        "content": json.dumps({"error": "missing required parameters"})
+                    }
+                    
+                result = await generate_code(requirement, language, framework)
+                return {
+                    "tool_call_id": tool_call.get("id", ""),
+                    "role": "tool",
+                    "name": "generateCode",
+                    "content": json.dumps(result)
+                }
+              # MCP工具调用处理
+            elif name.startswith("mcp_"):
+                # 这是MCP工具调用，通过MCP客户端处理
+                try:
+                    # 将mcp_server_tool格式转换回server:tool
+                    tool_key = name[4:].replace('_', ':', 1)  # 移除mcp_前缀，第一个_替换为:
+                    
+                    from app.services.mcp_client import mcp_client
+                    
+                    # 通过MCP客户端调用工具
+                    mcp_result = await mcp_client.call_tool(tool_key, arguments)
+                    
+                    return {
                         "tool_call_id": tool_call.get("id", ""),
                         "role": "tool",
                         "name": name,
-                        "content": json.dumps({"error": "不支持的工具"})
-                    })
-            except Exception as e:
-                # 处理工具执行错误
-                logger.error(f"工具调用错误 {name}: {str(e)}")
-                tool_results.append({
+                        "content": json.dumps(mcp_result)
+                    }
+                    
+                except Exception as e:
+                    logger.error(f"MCP工具调用失败 {name}: {str(e)}")
+                    return {
+                        "tool_call_id": tool_call.get("id", ""),
+                        "role": "tool",
+                        "name": name,
+                        "content": json.dumps({"success": False, "error": f"MCP工具调用失败: {str(e)}"})
+                    }
+            
+              # 不支持的工具
+            else:
+                return {
                     "tool_call_id": tool_call.get("id", ""),
                     "role": "tool",
                     "name": name,
-                    "content": json.dumps({"error": f"工具执行错误: {str(e)}"})
-                })
-        
-        # === Anthropic 最佳實踐：Ground Truth 驗證 ===
-        # 統一驗證所有工具結果
-        for tool_result in tool_results:
-            validation = validate_tool_result(tool_result)
-            # 將驗證結果添加到工具結果中
-            tool_result["validation"] = validation
-            
-            # 如果驗證失敗，記錄警告
-            if not validation["is_valid"]:
-                logger.warning(
-                    f"工具 {tool_result.get('name')} 驗證失敗: "
-                    f"{validation['reason']} (嚴重程度: {validation['severity']})"
-                )
-                
-        return tool_results
+                    "content": json.dumps({"error": "不支持的工具"})
+                }
+        except Exception as e:
+            # 处理工具执行错误
+            logger.error(f"工具调用错误 {name}: {str(e)}")
+            return {
+                "tool_call_id": tool_call.get("id", ""),
+                "role": "tool",
+                "name": name,
+                "content": json.dumps({"error": f"工具执行错误: {str(e)}"})
+            }
 
     # 給實時聊天完成方法提供簡化接口
     async def chat_completion(
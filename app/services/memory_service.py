@@ -1,6 +1,7 @@
 from typing import List, Dict, Any, Optional
 import httpx
 import json
+import asyncio
 from datetime import datetime
 
 from app.utils.logger import logger
@@ -9,18 +10,28 @@ from app.models.mongodb import (
     get_chat_logs, 
     update_user_memory, 
     get_user_memory,
+    aget_user_memory,
     get_chat_by_interaction_id
 )
 from app.services.llm_service import llm_service
+from app.utils.cache import TTLCache
 
 settings = get_settings()
 
+# 限制后台记忆更新的并发数，避免高并发时大量LLM请求触发速率限制、拖慢前台请求
+memory_update_semaphore = asyncio.Semaphore(getattr(settings, 'AGENT_MEMORY_CONCURRENCY', 4))
+
 
 class MemoryService:
     """記憶服務類"""
     def __init__(self):
         self.memory_model = getattr(settings, 'MEMORY_SERVICE_MODEL', "gemma-3-27b-it")  # 用於記憶處理的模型
         self.max_memory_chars = getattr(settings, 'AGENT_LONG_TERM_MEMORY_MAX_CHARS', 8000)  # 最大記憶字符數
+        # 用戶記憶讀取快取：連續請求時跳過 MongoDB 讀取，任何寫入路徑都會使其失效
+        self.memory_cache = None
+        memory_cache_ttl = getattr(settings, 'AGENT_MEMORY_CACHE_TTL', 60)
+        if memory_cache_ttl > 0:
+            self.memory_cache = TTLCache(max_entries=1024, ttl=memory_cache_ttl)
         
     async def update_memory(self, user_id: str, prompt: str) -> str:
         """
@@ -116,8 +127,9 @@ class MemoryService:
                     # 尝试获取完整的响应信息
                     logger.warning(f"完整响应: {json.dumps(result, ensure_ascii=False)}")
                 
-                # 更新MongoDB中的記憶
+                # 更新MongoDB中的記憶，並使快取的舊記憶失效
                 update_user_memory(user_id, memory_update)
+                self.invalidate_memory(user_id)
                 logger.info(f"記憶更新完成，使用者ID: {user_id}")
                 
                 return memory_update
@@ -141,7 +153,25 @@ class MemoryService:
         Returns:
             用戶記憶
         """
-        return get_user_memory(user_id)
+        if self.memory_cache is None:
+            return await aget_user_memory(user_id)
+        memory = self.memory_cache.get(user_id)
+        if memory is None:
+            memory = await aget_user_memory(user_id)
+            self.memory_cache.set(user_id, memory)
+        return memory
+
+    def invalidate_memory(self, user_id: str):
+        """
+        移除用戶記憶的快取
+        
+        不經過 update_memory 直接寫入記憶的路徑（如 saveToMemory 工具）需在寫入後調用
+        
+        Args:
+            user_id: 用戶ID
+        """
+        if self.memory_cache is not None:
+            self.memory_cache.delete(user_id)
 
     async def get_history_by_id(self, history_id: str, user_id: str) -> Optional[Dict[str, str]]:
         """
@@ -9,6 +9,8 @@ from typing import List, Dict, Any, Optional, AsyncIterator
 from enum import Enum
 from datetime import datetime
 
+import orjson
+
 from app.utils.logger import logger
 
 
@@ -92,6 +94,16 @@ class BaseProvider(ABC):
         settings = get_settings()
         return model_name.lower() not in [m.lower() for m in settings.UNSUPPORTED_TOOL_MODELS]
     
+    @staticmethod
+    def _encode_body(body: Dict[str, Any]) -> bytes:
+        """
+        序列化請求體為 JSON bytes
+        
+        使用 orjson 代替 httpx json= 參數背後的標準庫 json，
+        每輪 Agent 請求都會重新序列化的工具定義與消息歷史可明顯降低編碼耗時
+        """
+        return orjson.dumps(body, option=orjson.OPT_NON_STR_KEYS)
+    
     def _format_standard_response(
         self,
         content: str,
@@ -200,21 +212,32 @@ class BaseProvider(ABC):
             "detail": detail
         }
     
-    def _format_stream_error(self, error: str, detail: str = "") -> Dict[str, Any]:
+    def _format_stream_error(
+        self,
+        error: str,
+        detail: str = "",
+        status_code: Optional[int] = None,
+        retry_after: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
         格式化流式錯誤響應
         
         Args:
             error: 錯誤訊息
             detail: 詳細信息
+            status_code: 上游 HTTP 狀態碼（如有），供調用方按狀態碼判斷錯誤類型
+            retry_after: 上游 Retry-After 響應頭（如有）
             
         Returns:
             SSE 格式的錯誤響應
         """
-        return {
-            "error": {
-                "message": error,
-                "detail": detail,
-                "type": "stream_error"
-            }
+        error_info = {
+            "message": error,
+            "detail": detail,
+            "type": "stream_error"
         }
+        if status_code is not None:
+            error_info["status_code"] = status_code
+        if retry_after is not None:
+            error_info["retry_after"] = retry_after
+        return {"error": error_info}
@@ -65,6 +65,9 @@ class GitHubModelProvider(BaseProvider):
             "stream_options": {"include_usage": True}  # 請求最後返回使用量統計
         }
         
+        if "temperature" in kwargs:
+            body["temperature"] = kwargs["temperature"]
+        
         if tools and self.supports_tools(model_name):
             body["tools"] = tools
             body["tool_choice"] = "auto"
@@ -75,14 +78,16 @@ class GitHubModelProvider(BaseProvider):
                     "POST",
                     url,
                     headers=headers,
-                    json=body
+                    content=self._encode_body(body)
                 ) as response:
                     if response.status_code != 200:
                         error_text = await response.aread()
                         self.logger.error(f"GitHub Streaming API 錯誤 {response.status_code}: {error_text.decode()}")
                         yield self._format_stream_error(
                             f"API 錯誤 {response.status_code}",
-                            error_text.decode()
+                            error_text.decode(),
+                            status_code=response.status_code,
+                            retry_after=response.headers.get("retry-after")
                         )
                         return
                     
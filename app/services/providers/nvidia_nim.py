@@ -82,14 +82,16 @@ class NvidiaNimProvider(BaseProvider):
                     "POST",
                     url,
                     headers=headers,
-                    json=body
+                    content=self._encode_body(body)
                 ) as response:
                     if response.status_code != 200:
                         error_text = await response.aread()
                         self.logger.error(f"NVIDIA NIM Streaming API 錯誤 {response.status_code}: {error_text.decode()}")
                         yield self._format_stream_error(
                             f"API 錯誤 {response.status_code}",
-                            error_text.decode()
+                            error_text.decode(),
+                            status_code=response.status_code,
+                            retry_after=response.headers.get("retry-after")
                         )
                         return
                     
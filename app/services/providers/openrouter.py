@@ -74,6 +74,9 @@ class OpenRouterProvider(BaseProvider):
             "stream": True
         }
         
+        if "temperature" in kwargs:
+            body["temperature"] = kwargs["temperature"]
+        
         if tools and self.supports_tools(model_name):
             body["tools"] = tools
             body["tool_choice"] = "auto"
@@ -93,14 +96,16 @@ class OpenRouterProvider(BaseProvider):
                     "POST",
                     url,
                     headers=headers,
-                    json=body
+                    content=self._encode_body(body)
                 ) as response:
                     if response.status_code != 200:
                         error_text = await response.aread()
                         self.logger.error(f"OpenRouter Streaming API 錯誤 {response.status_code}: {error_text.decode()}")
                         yield self._format_stream_error(
                             f"API 錯誤 {response.status_code}",
-                            error_text.decode()
+                            error_text.decode(),
+                            status_code=response.status_code,
+                            retry_after=response.headers.get("retry-after")
                         )
                         return
                     
@@ -0,0 +1,115 @@
+"""
+快取工具 - 進程內的 TTL + LRU 快取
+
+提供：
+1. TTLCache - 基於 OrderedDict 的通用 LRU 快取，每個條目帶過期時間
+2. LLMCache - LLM 響應快取，以 (模型, 消息, 工具名稱) 的 SHA-256 作為鍵，
+   只快取確定性請求（temperature=0）
+"""
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional
+
+import orjson
+
+
+class TTLCache:
+    """帶過期時間的 LRU 快取（單進程內存，適用於單一事件循環）"""
+
+    def __init__(self, max_entries: int = 256, ttl: float = 600.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """讀取條目，不存在或已過期時返回 None"""
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """寫入條目，超過容量時淘汰最久未使用的條目"""
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        """移除條目（不存在時忽略）"""
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+class LLMCache:
+    """
+    LLM 響應快取
+
+    響應以 orjson bytes 存放，每次讀取都返回新的字典副本，
+    調用方修改返回值不會污染快取。backend 只需提供 get/set/stats。
+    """
+
+    def __init__(self, backend: TTLCache):
+        self.backend = backend
+
+    @staticmethod
+    def make_key(
+        model_name: str,
+        messages: List[Dict[str, Any]],
+        tools: Optional[List[Dict[str, Any]]] = None,
+        temperature: Optional[float] = None
+    ) -> Optional[str]:
+        """
+        計算快取鍵，以下情況返回 None（不讀取也不寫入快取）：
+        - 採樣請求：temperature 不為 0（None 表示使用 Provider 默認溫度，同樣視為採樣）
+        - 消息無法序列化
+        """
+        if temperature != 0:
+            return None
+        tool_names = sorted(
+            tool.get("function", {}).get("name", "") for tool in (tools or [])
+        )
+        try:
+            payload = orjson.dumps(
+                {"model": model_name, "messages": messages, "tools": tool_names},
+                option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+            )
+        except TypeError:
+            return None
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.backend.get(key)
+        if raw is None:
+            return None
+        return orjson.loads(raw)
+
+    def set(self, key: str, response: Dict[str, Any]) -> None:
+        try:
+            self.backend.set(key, orjson.dumps(response, option=orjson.OPT_NON_STR_KEYS))
+        except TypeError:
+            pass
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return self.backend.stats
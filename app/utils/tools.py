@@ -4,6 +4,7 @@ import base64
 import os
 import time
 import json
+import orjson
 import re
 from datetime import datetime
 import uuid
@@ -21,6 +22,10 @@ from app.core.config import get_settings
 
 settings = get_settings()
 
+# 模型输出中 ```json 代码块的提取模式（预编译，供各工具共用）
+# 调用处先以子串检查过滤不含代码块的文本，避免无谓的正则扫描
+_JSON_FENCE_RE = re.compile(r'```json\s*([\s\S]*?)\s*```')
+
 # ---------- Agent 增強工具  ----------
 
 # MARK: Ground Truth 驗證
@@ -48,25 +53,27 @@ def validate_tool_result(tool_result: Dict[str, Any]) -> Dict[str, Any]:
             "severity": "high"
         }
     
+    # JSON 對象形式的結果只解析一次（orjson），供以下各項檢查共用
+    parsed = content
+    if isinstance(content, str):
+        parsed = None
+        if content.startswith("{"):
+            try:
+                parsed = orjson.loads(content)
+            except orjson.JSONDecodeError:
+                pass
+    
     # 檢查 2: 是否包含錯誤標記
-    try:
-        content_lower = content.lower() if isinstance(content, str) else str(content).lower()
-        # 嘗試解析 JSON 錯誤
-        if isinstance(content, str) and content.startswith("{"):
-            parsed = json.loads(content)
-            if isinstance(parsed, dict) and "error" in parsed:
-                return {
-                    "is_valid": False,
-                    "reason": f"工具返回錯誤: {parsed.get('error', 'unknown')}",
-                    "severity": "high"
-                }
-    except (json.JSONDecodeError, TypeError):
-        pass
+    if isinstance(parsed, dict) and "error" in parsed:
+        return {
+            "is_valid": False,
+            "reason": f"工具返回錯誤: {parsed.get('error', 'unknown')}",
+            "severity": "high"
+        }
     
     # 檢查 3: 搜索工具特殊驗證
     if tool_name in ["searchDuckDuckGo", "search"]:
         try:
-            parsed = json.loads(content) if isinstance(content, str) else content
             results = parsed.get("results", [])
             if not results or len(results) == 0:
                 return {
@@ -74,7 +81,7 @@ def validate_tool_result(tool_result: Dict[str, Any]) -> Dict[str, Any]:
                     "reason": "搜索無結果，可能需要調整搜索詞",
                     "severity": "low"
                 }
-        except (json.JSONDecodeError, TypeError, AttributeError):
+        except AttributeError:
             pass
     
     # 檢查 4: 網頁抓取工具驗證
@@ -87,24 +94,19 @@ def validate_tool_result(tool_result: Dict[str, Any]) -> Dict[str, Any]:
             }
     
     # 檢查 5: 圖片生成工具驗證
-    if tool_name == "generateImage":
-        try:
-            parsed = json.loads(content) if isinstance(content, str) else content
-            if isinstance(parsed, dict):
-                if parsed.get("error"):
-                    return {
-                        "is_valid": False,
-                        "reason": f"圖片生成失敗: {parsed.get('error')}",
-                        "severity": "medium"
-                    }
-                if not parsed.get("success"):
-                    return {
-                        "is_valid": False,
-                        "reason": "圖片生成未成功",
-                        "severity": "medium"
-                    }
-        except (json.JSONDecodeError, TypeError):
-            pass
+    if tool_name == "generateImage" and isinstance(parsed, dict):
+        if parsed.get("error"):
+            return {
+                "is_valid": False,
+                "reason": f"圖片生成失敗: {parsed.get('error')}",
+                "severity": "medium"
+            }
+        if not parsed.get("success"):
+            return {
+                "is_valid": False,
+                "reason": "圖片生成未成功",
+                "severity": "medium"
+            }
     
     return {
         "is_valid": True,
@@ -549,7 +551,7 @@ async def format_content(content: str, output_format: str) -> Dict[str, Any]:
                     format_text = format_response["choices"][0]["message"].get("content", "")
                     
                     # 提取JSON部分
-                    json_match = re.search(r'```json\s*([\s\S]*?)\s*```', format_text)
+                    json_match = _JSON_FENCE_RE.search(format_text) if "```json" in format_text else None
                     if json_match:
                         format_text = json_match.group(1)
                     
@@ -783,7 +785,7 @@ async def generate_structured_data(
             # 处理不同数据类型
             if data_type.lower() == "json":
                 # 提取JSON部分
-                json_match = re.search(r'```json\s*([\s\S]*?)\s*```', content)
+                json_match = _JSON_FENCE_RE.search(content) if "```json" in content else None
                 if json_match:
                     content = json_match.group(1)
                 
@@ -1022,8 +1024,10 @@ async def save_to_memory(user_id: str, key: str, value: Any) -> Dict[str, Any]:
         # 更新记忆字典
         memory_dict[key] = value
         
-        # 保存更新后的记忆
+        # 保存更新后的记忆，并使记忆服务中的快取失效
         update_user_memory(user_id, memory_dict)
+        from app.services.memory_service import memory_service
+        memory_service.invalidate_memory(user_id)
         
         return {
             "success": True,
@@ -1150,11 +1154,11 @@ async def create_date_plan(
             plan_text = response["choices"][0]["message"].get("content", "")
             
             # 尝试提取JSON格式的计划
-            json_match = re.search(r'```json\s*([\s\S]*?)\s*```', plan_text)
+            json_match = _JSON_FENCE_RE.search(plan_text) if "```json" in plan_text else None
             if json_match:
                 plan_json = json_match.group(1)
                 try:
-                    plan = json.loads(plan_json)
+                    plan = orjson.loads(plan_json)
                     return {
                         "success": True,
                         "location": location,
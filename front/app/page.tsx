@@ -1161,6 +1161,9 @@ export default function ModernChatGPT() {
 
         // 使用 SSE 流式請求
         let accumulatedReactSteps: ReactStep[] = []
+        // 模型輸出增量（status: 'streaming'）按步驟累加的文本
+        let streamedText = ''
+        let streamedStep: number | undefined = undefined
         
         await makeAgentStreamRequest(
           body,
@@ -1169,6 +1172,22 @@ export default function ModernChatGPT() {
           {
             // 處理中間步驟
             onStep: (step) => {
+              // 模型輸出增量：累加到當前回覆中顯示，不創建新的推理步驟
+              if (step.status === 'streaming') {
+                if (streamedStep !== step.step) {
+                  streamedStep = step.step
+                  streamedText = ''
+                }
+                streamedText += step.message || ''
+                const text = streamedText
+                setMessages(prev => prev.map(msg => 
+                  msg.id === assistantMessage.id 
+                    ? { ...msg, content: `**✍️ 生成中**\n\n${text}` }
+                    : msg
+                ))
+                return
+              }
+              
               console.log('📍 Agent step:', step.status, step.message, step.tool_name)
               
               // 狀態映射 - responding 和 summarizing 都是最終回覆階段，不應標記為反思
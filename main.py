@@ -24,7 +24,8 @@ if sys.platform == "win32":
         asyncio.set_event_loop(loop)
 
 from app.core.config import get_settings
-from app.models.sqlite import init_sqlite
+from app.models.sqlite import init_sqlite, start_sqlite_writer, stop_sqlite_writer
+from app.models.mongodb import ensure_indexes
 from app.routers import api
 from app.utils.logger import logger
 
@@ -124,6 +125,12 @@ async def startup_event():
     """应用启动时执行的事件"""
     logger.info("应用启动...")
     
+    # 启动SQLite后台写入任务
+    start_sqlite_writer()
+    
+    # 在后台创建MongoDB索引（不阻塞启动，数据库暂不可用时只记录错误）
+    app.state.mongodb_index_task = asyncio.create_task(ensure_indexes())
+    
     # 检查是否需要初始化MCP客户端
     mcp_client = None
     try:
@@ -218,6 +225,16 @@ async def shutdown_event():
     except Exception as e:
         logger.error(f"关闭MCP客户端连接失败: {e}")
         logger.error(traceback.format_exc())
+    
+    # 等待Agent的后台任务（聊天记录、记忆更新、使用统计）完成，再关闭SQLite写入队列
+    try:
+        from app.services.agent_service import agent_service
+        await agent_service.drain_background_tasks(settings.AGENT_SHUTDOWN_DRAIN_TIMEOUT)
+    except Exception as e:
+        logger.error(f"等待Agent后台任务失败: {e}")
+    
+    # 写完队列中剩余的SQLite记录
+    await stop_sqlite_writer()
 
 # 主程序入口点
 if __name__ == "__main__":
@@ -0,0 +1,20 @@
+"""
+測試公共夾具
+"""
+
+import pytest
+
+
+@pytest.fixture
+def app_env(monkeypatch, tmp_path):
+    """
+    導入應用模塊前的運行環境：日誌與使用量文件寫在臨時工作目錄下
+    （應用啟動時由 main.py 創建 logs 目錄），並補齊必填配置項
+    """
+    pytest.importorskip("pydantic_settings")
+    pytest.importorskip("fastapi")
+    (tmp_path / "logs").mkdir()
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENROUTER_APP_URL", "http://localhost")
+    monkeypatch.setenv("OPENROUTER_APP_TITLE", "test")
+    return tmp_path
@@ -0,0 +1,78 @@
+"""
+上下文裁剪測試：按 token 預算省略較早輪次，tool_calls 與對應的 tool 結果不被拆開
+"""
+
+
+def _round(index: int, tool_count: int):
+    """構建一輪工具調用：assistant(tool_calls) + 對應的 tool 結果"""
+    tool_calls = [
+        {
+            "id": f"call_{index}_{i}",
+            "type": "function",
+            "function": {"name": "searchDuckDuckGo", "arguments": '{"query": "q"}'}
+        }
+        for i in range(tool_count)
+    ]
+    messages = [{"role": "assistant", "content": "", "tool_calls": tool_calls}]
+    for tool_call in tool_calls:
+        messages.append({
+            "role": "tool",
+            "tool_call_id": tool_call["id"],
+            "name": "searchDuckDuckGo",
+            "content": "x" * 400
+        })
+    return messages
+
+
+def _conversation(rounds: int):
+    messages = [
+        {"role": "system", "content": "system prompt"},
+        {"role": "user", "content": "question"},
+    ]
+    for index in range(rounds):
+        # 每輪的工具數不同，確保多條 tool 結果的輪次也被整體處理
+        messages.extend(_round(index, index % 3 + 1))
+    return messages
+
+
+def test_prune_keeps_tool_groups_together(app_env):
+    from app.services.agent_service import _prune_to_budget, _estimate_tokens
+
+    messages = _conversation(10)
+    budget = sum(_estimate_tokens(message) for message in messages) // 3
+    pruned = _prune_to_budget(messages, budget, keep_last=2)
+
+    # 保留開頭的系統提示與第一條用戶消息，並插入一條省略說明
+    assert pruned[:2] == messages[:2]
+    assert pruned[2]["role"] == "system" and "已省略" in pruned[2]["content"]
+    assert len(pruned) < len(messages)
+
+    # 每條 tool 結果都緊跟在發起它的 assistant 之後，且每個 tool_call 都有對應結果
+    expected_ids = []
+    for message in pruned[3:]:
+        if message["role"] == "assistant":
+            assert not expected_ids
+            expected_ids = [tool_call["id"] for tool_call in message["tool_calls"]]
+        else:
+            assert message["role"] == "tool"
+            assert message["tool_call_id"] == expected_ids.pop(0)
+    assert not expected_ids
+
+    # 原列表不被修改
+    assert len(messages) == 2 + sum(1 + index % 3 + 1 for index in range(10))
+
+
+def test_prune_keeps_last_groups_even_over_budget(app_env):
+    from app.services.agent_service import _prune_to_budget
+
+    messages = _conversation(5)
+    pruned = _prune_to_budget(messages, budget=1, keep_last=2)
+    assert pruned[3:] == messages[-len(pruned[3:]):]
+    assert sum(1 for message in pruned if message["role"] == "assistant") == 2
+
+
+def test_prune_returns_messages_within_budget_unchanged(app_env):
+    from app.services.agent_service import _prune_to_budget
+
+    messages = _conversation(2)
+    assert _prune_to_budget(messages, budget=10 ** 6) is messages
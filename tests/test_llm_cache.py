@@ -0,0 +1,45 @@
+"""
+LLM 響應快取測試：只有確定性請求（temperature=0）會讀寫快取
+"""
+
+import asyncio
+
+from app.utils.cache import LLMCache, TTLCache
+
+
+MESSAGES = [{"role": "user", "content": "hello"}]
+
+
+def test_make_key_skips_sampled_requests():
+    # None 表示使用 Provider 默認溫度，同樣屬於採樣請求
+    assert LLMCache.make_key("gpt-4o-mini", MESSAGES, temperature=None) is None
+    assert LLMCache.make_key("gpt-4o-mini", MESSAGES, temperature=0.7) is None
+    assert LLMCache.make_key("gpt-4o-mini", MESSAGES, temperature=0) is not None
+
+
+def test_sampled_agent_request_bypasses_cache(app_env, monkeypatch):
+    from app.services import agent_service as agent_module
+
+    calls = []
+
+    async def fake_send_llm_request(messages, model_name, tools=None, **kwargs):
+        calls.append(kwargs.get("temperature"))
+        return {"choices": [{"message": {"role": "assistant", "content": "hi"}, "finish_reason": "stop"}]}
+
+    monkeypatch.setattr(agent_module.llm_service, "send_llm_request", fake_send_llm_request)
+
+    service = agent_module.AgentService()
+    service.llm_cache = LLMCache(TTLCache(max_entries=8, ttl=60))
+
+    # 採樣請求：每次都發送到模型，且不寫入快取
+    service.temperature = 0.7
+    asyncio.run(service._send_request_with_retry(MESSAGES, "gpt-4o-mini"))
+    asyncio.run(service._send_request_with_retry(MESSAGES, "gpt-4o-mini"))
+    assert calls == [0.7, 0.7]
+    assert service.llm_cache.stats["size"] == 0
+
+    # 確定性請求：第二次直接命中快取
+    service.temperature = 0
+    asyncio.run(service._send_request_with_retry(MESSAGES, "gpt-4o-mini"))
+    asyncio.run(service._send_request_with_retry(MESSAGES, "gpt-4o-mini"))
+    assert calls == [0.7, 0.7, 0]
@@ -0,0 +1,81 @@
+"""
+用戶記憶快取測試：任何寫入路徑之後，下一次 Agent 執行都能讀到新記憶
+"""
+
+import asyncio
+
+
+def test_memory_write_is_visible_on_next_run(app_env, monkeypatch):
+    from app.services import agent_service as agent_module
+    from app.services import memory_service as memory_module
+    from app.utils import tools as tools_module
+    from app.models import mongodb as mongodb_module
+
+    store = {"user": "舊記憶"}
+    reads = []
+
+    async def fake_aget_user_memory(user_id):
+        reads.append(user_id)
+        return store.get(user_id, "")
+
+    def fake_update_user_memory(user_id, memory):
+        store[user_id] = memory if isinstance(memory, str) else str(memory)
+
+    monkeypatch.setattr(memory_module, "aget_user_memory", fake_aget_user_memory)
+    monkeypatch.setattr(memory_module, "get_user_memory", lambda user_id: store.get(user_id, ""))
+    monkeypatch.setattr(memory_module, "update_user_memory", fake_update_user_memory)
+    monkeypatch.setattr(memory_module, "get_chat_logs", lambda user_id, limit: [])
+    monkeypatch.setattr(mongodb_module, "get_user_memory", lambda user_id: store.get(user_id, ""))
+    monkeypatch.setattr(mongodb_module, "update_user_memory", fake_update_user_memory)
+
+    service = memory_module.memory_service
+    monkeypatch.setattr(service, "memory_cache", agent_module.TTLCache(max_entries=8, ttl=60))
+
+    sent_memory = []
+
+    async def fake_send_llm_request(messages, model_name, tools=None, **kwargs):
+        if model_name == service.memory_model:
+            return {"choices": [{"message": {"role": "assistant", "content": "新記憶：用戶喜歡貓"}}]}
+        sent_memory.append("\n".join(str(message.get("content")) for message in messages))
+        return {"choices": [{"message": {"role": "assistant", "content": "好的"}, "finish_reason": "stop"}]}
+
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(agent_module.llm_service, "send_llm_request", fake_send_llm_request)
+    monkeypatch.setattr(agent_module, "create_chat_log", noop)
+    monkeypatch.setattr(agent_module.AgentService, "_update_usage_stats", lambda self, *args, **kwargs: None)
+    monkeypatch.setattr(agent_module.settings, "AGENT_AUTO_SAVE_MEMORY", False)
+    monkeypatch.setattr(agent_module.settings, "AGENT_ENABLE_SELF_EVALUATION", False)
+
+    agent = agent_module.AgentService()
+    agent.llm_cache = None
+    agent.plan_cache = None
+    agent.response_cache = None
+
+    async def run_agent():
+        return await agent.run(
+            "user", "你好", "gpt-4o-mini",
+            enable_reflection=False, enable_mcp=False
+        )
+
+    async def scenario():
+        await run_agent()
+        await run_agent()
+        # 第二次執行命中快取，不再讀取數據庫
+        assert reads == ["user"]
+
+        # /memory/update 與聊天端點的後台更新都經過 update_memory
+        await service.update_memory("user", "我喜歡貓")
+        await run_agent()
+
+        # saveToMemory 工具直接寫入數據庫
+        await tools_module.save_to_memory("user", "pet", "cat")
+        await run_agent()
+
+    asyncio.run(scenario())
+    assert len(sent_memory) == 4
+    assert "舊記憶" in sent_memory[0] and "舊記憶" in sent_memory[1]
+    assert "新記憶：用戶喜歡貓" in sent_memory[2]
+    assert "cat" in sent_memory[3]
+    assert reads == ["user", "user", "user"]
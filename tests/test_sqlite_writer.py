@@ -0,0 +1,64 @@
+"""
+SQLite 後台寫入測試：停止寫入任務前，隊列中的聊天記錄全部落盤
+"""
+
+import asyncio
+import sqlite3
+
+
+def _count_chat_logs(db_path) -> int:
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM chat_log").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_stop_drains_queued_chat_logs(app_env, monkeypatch):
+    from app.models import sqlite as sqlite_module
+
+    db_path = str(app_env / "chat.db")
+    monkeypatch.setattr(sqlite_module.settings, "SQLITE_DB", db_path)
+    sqlite_module.init_sqlite()
+
+    async def scenario():
+        sqlite_module.start_sqlite_writer()
+        # 超過單批上限，覆蓋多次批量提交
+        for i in range(sqlite_module._WRITER_BATCH_SIZE + 50):
+            assert sqlite_module.enqueue_chat_log_sqlite("user", "model", f"prompt {i}", "reply", f"id-{i}")
+        await sqlite_module.stop_sqlite_writer(timeout=5)
+
+    asyncio.run(scenario())
+    assert _count_chat_logs(db_path) == sqlite_module._WRITER_BATCH_SIZE + 50
+    assert sqlite_module._writer_task is None and sqlite_module._log_queue is None
+
+    # 寫入任務停止後回退為同步寫入
+    assert sqlite_module.enqueue_chat_log_sqlite("user", "model", "late", "reply")
+    assert _count_chat_logs(db_path) == sqlite_module._WRITER_BATCH_SIZE + 51
+
+
+def test_dead_writer_falls_back_to_sync_writes(app_env, monkeypatch, caplog):
+    from app.models import sqlite as sqlite_module
+
+    db_path = str(app_env / "chat.db")
+    monkeypatch.setattr(sqlite_module.settings, "SQLITE_DB", db_path)
+    sqlite_module.init_sqlite()
+
+    def broken_connection():
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(sqlite_module, "_open_writer_connection", broken_connection)
+
+    async def scenario():
+        sqlite_module.start_sqlite_writer()
+        # 讓寫入任務運行並因無法打開連接而退出
+        await asyncio.wait({sqlite_module._writer_task}, timeout=5)
+        assert sqlite_module._writer_task.done()
+        for i in range(3):
+            assert sqlite_module.enqueue_chat_log_sqlite("user", "model", f"prompt {i}", "reply")
+        assert sqlite_module._log_queue.empty()
+        await sqlite_module.stop_sqlite_writer(timeout=5)
+
+    asyncio.run(scenario())
+    assert _count_chat_logs(db_path) == 3
+    assert "SQLite后台写入任务异常退出" in caplog.text
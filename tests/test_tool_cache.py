@@ -0,0 +1,61 @@
+"""
+工具結果快取測試：失敗或空結果不寫入快取
+"""
+
+import asyncio
+
+
+def test_empty_or_failed_results_are_not_cacheable(app_env):
+    from app.services import llm_service as llm_module
+    is_cacheable = llm_module._is_cacheable_tool_result
+
+    assert not is_cacheable("")
+    assert not is_cacheable('{"results": []}')
+    assert not is_cacheable('{"error": "Failed to fetch webpage content"}')
+    assert not is_cacheable('{"success": false}')
+    assert not is_cacheable('{"success": true, "content": ""}')
+    assert is_cacheable('{"results": [{"title": "t", "snippet": "s", "url": "u"}]}')
+    assert is_cacheable('{"success": true, "content": "text"}')
+    assert is_cacheable("plain text result")
+
+
+def test_empty_search_is_retried(app_env, monkeypatch):
+    from app.services import llm_service as llm_module
+    from app.utils.cache import TTLCache
+    service = llm_module.llm_service
+    monkeypatch.setattr(service, "tool_cache", TTLCache(max_entries=8, ttl=60))
+
+    responses = [[], [{"title": "t", "snippet": "s", "url": "u"}]]
+    calls = []
+
+    async def fake_search(query, num_results=5):
+        calls.append(query)
+        return responses[len(calls) - 1]
+
+    # handle_single_tool_call 在函數內導入工具，需替換 tools 模塊上的函數
+    from app.utils import tools as tools_module
+    monkeypatch.setattr(tools_module, "search_duckduckgo", fake_search)
+    tool_call = {
+        "id": "call_1",
+        "type": "function",
+        "function": {"name": "searchDuckDuckGo", "arguments": '{"query": "castorice"}'}
+    }
+
+    # 第一次返回空結果，不應寫入快取；第二次重新執行並快取非空結果
+    asyncio.run(service._handle_tool_call_cached(tool_call))
+    second = asyncio.run(service._handle_tool_call_cached(tool_call))
+    third = asyncio.run(service._handle_tool_call_cached(tool_call))
+    assert calls == ["castorice", "castorice"]
+    assert "cached" not in second
+    assert third.get("cached") is True
+
+
+def test_llm_backed_tools_are_not_cached(app_env):
+    from app.services import llm_service as llm_module
+
+    service = llm_module.llm_service
+    for name in ("translateText", "generateCode", "summarizeContent", "saveToMemory", "mcp_server_tool"):
+        tool_call = {"id": "call_1", "function": {"name": name, "arguments": '{"text": "hi"}'}}
+        assert service._tool_cache_key(tool_call) is None
+    search_call = {"id": "call_2", "function": {"name": "searchDuckDuckGo", "arguments": '{"query": "hi"}'}}
+    assert service._tool_cache_key(search_call) is not None